@@ -1,12 +1,13 @@
 from __future__ import annotations
 import sys
-from app.ingestion.schema_ingest import ingest_schema_cards
-from app.graph.app import APP
-from app.graph.state import QAState
+
+# Keep module-level imports to the stdlib: each subcommand imports only its own
+# stack (ingestion vs. graph) so `--help` and light commands start instantly.
 
 USAGE = """Usage:
-  python -m app.cli ingest-schema --schemas public[,app] [--samples 3]
+  python -m app.cli ingest-schema --schemas public[,app] [--samples 3] [--no-resume]
   python -m app.cli ask "What was monthly revenue in 2024 by product line?"
+  python -m app.cli rollups list|create|refresh [name ...]
 """
 
 def main(argv:list[str]) -> int:
@@ -14,19 +15,25 @@ def main(argv:list[str]) -> int:
         print(USAGE); return 1
     cmd = argv[1]
 
+    if cmd in ("-h", "--help", "help"):
+        print(USAGE); return 0
+
     if cmd == "ingest-schema":
-        schemas=[]; samples=0
+        schemas=[]; samples=0; resume="--no-resume" not in argv
         args = argv[2:]
         for i,a in enumerate(args):
             if a=="--schemas" and i+1<len(args):
                 schemas=[s.strip() for s in args[i+1].split(",") if s.strip()]
             if a=="--samples" and i+1<len(args):
                 samples=int(args[i+1])
-        n = ingest_schema_cards(schemas=schemas, per_table_samples=samples)
+        from app.ingestion.schema_ingest import ingest_schema_cards
+        n = ingest_schema_cards(schemas=schemas, per_table_samples=samples, resume=resume)
         print(f"Ingested {n} schema/metric cards into FAISS.")
         return 0
 
     if cmd == "ask":
+        from app.graph.app import get_app
+        from app.graph.state import QAState
         q = " ".join(argv[2:])
         state: QAState = {
             "question": q,
@@ -42,10 +49,25 @@ def main(argv:list[str]) -> int:
             "answer": None,
             "evidence": {},
         }
-        out = APP.invoke(state)
+        out = get_app().invoke(state)
         print(out.get("answer",""))
         return 0
 
+    if cmd == "rollups":
+        action = argv[2] if len(argv) > 2 else "list"
+        names = argv[3:] or None
+        from app.tools import rollup_tools
+        if action == "list":
+            for r in rollup_tools.load_rollups():
+                print(f"{r['name']} <- {r['source']} grain={r.get('grain')} dims={r['dimensions']} measures={list(r['measures'])}")
+            return 0
+        if action == "create":
+            print(f"Created: {', '.join(rollup_tools.create_rollups(names)) or '(none)'}")
+            return 0
+        if action == "refresh":
+            print(f"Refreshed: {', '.join(rollup_tools.refresh_rollups(names)) or '(none)'}")
+            return 0
+
     print(USAGE); return 1
 
 if __name__ == "__main__":
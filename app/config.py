@@ -5,6 +5,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # LLM
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")  # gemini | mock
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT", "")  # grpc (SDK default) | rest
+MOCK_EMBED_DIM = int(os.getenv("MOCK_EMBED_DIM", "64"))
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GENERATION_MODEL = os.getenv("GENERATION_MODEL", "gemini-1.5-flash")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "gemini-embedding-001")
@@ -13,6 +16,7 @@ EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "gemini-embedding-001")
 API_TIMEOUT_SECONDS = int(os.getenv("API_TIMEOUT_SECONDS", "30"))
 API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3"))
 API_RETRY_DELAY = int(os.getenv("API_RETRY_DELAY", "2"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
 
 # DB (Postgres)
 PGHOST=os.getenv("PGHOST","localhost")
@@ -21,17 +25,74 @@ PGDATABASE=os.getenv("PGDATABASE","postgres")
 PGUSER=os.getenv("PGUSER","postgres")
 PGPASSWORD=os.getenv("PGPASSWORD","postgres")
 DSN=f"postgresql+psycopg2://{PGUSER}:{PGPASSWORD}@{PGHOST}:{PGPORT}/{PGDATABASE}"
+# Read routing (app.db.router): catalog reads and generated SELECTs go to replicas,
+# the primary (DSN) only serves writes or stands in when no replica qualifies.
+# SCHEMA_ROUTES sends a schema/tenant to its own database(s): "tenant_a=dsn1|dsn2;tenant_b=dsn3"
+REPLICA_DSNS=[d.strip() for d in os.getenv("REPLICA_DSNS","").split(",") if d.strip()]
+SCHEMA_ROUTES=os.getenv("SCHEMA_ROUTES","")
+REPLICA_MAX_LAG_MS=int(os.getenv("REPLICA_MAX_LAG_MS","5000"))
+REPLICA_HEALTH_INTERVAL_SECONDS=float(os.getenv("REPLICA_HEALTH_INTERVAL_SECONDS","5"))
+DB_POOL_SIZE=int(os.getenv("DB_POOL_SIZE","5"))
+DB_MAX_OVERFLOW=int(os.getenv("DB_MAX_OVERFLOW","10"))
 
 # Safety & retrieval
 ALLOWED_SCHEMAS=[s.strip() for s in os.getenv("ALLOWED_SCHEMAS","public").split(",") if s.strip()]
 MAX_SQL_ROWS=int(os.getenv("MAX_SQL_ROWS","200"))
 MAX_EST_ROWS=int(os.getenv("MAX_EST_ROWS","1000000"))
-MAX_EST_COST=float(os.getenv("MAX_EST_COST","1000000"))
+# Cost gate: predicted runtime budget (ms). The predictor is calibrated from executed
+# queries in QUERY_HISTORY_PATH; with no history it assumes DEFAULT_MS_PER_COST per
+# planner cost unit. EXPLAIN_ANALYZE_SAMPLE_RATE is the share of previews, and of
+# gated-out queries, re-run under EXPLAIN (ANALYZE, BUFFERS) to learn from.
+MAX_QUERY_MS=int(os.getenv("MAX_QUERY_MS","15000"))
+DEFAULT_MS_PER_COST=float(os.getenv("DEFAULT_MS_PER_COST","0.015"))
+EXPLAIN_ANALYZE_SAMPLE_RATE=float(os.getenv("EXPLAIN_ANALYZE_SAMPLE_RATE","0.1"))
+COST_HISTORY_WINDOW=int(os.getenv("COST_HISTORY_WINDOW","50"))
 TOP_K=int(os.getenv("TOP_K","6"))
+# Whole-question budget shared by every graph node, LLM call and SQL statement,
+# and how many times the graph may loop back to generate.
+QUESTION_TIMEOUT_SECONDS=float(os.getenv("QUESTION_TIMEOUT_SECONDS","60"))
+MAX_GENERATE_ATTEMPTS=int(os.getenv("MAX_GENERATE_ATTEMPTS","4"))
+DB_CANCEL_GRACE_MS=int(os.getenv("DB_CANCEL_GRACE_MS","500"))
+# Connect timeout for every database connection (incl. health checks and query cancels).
+DB_CONNECT_TIMEOUT_SECONDS=int(os.getenv("DB_CONNECT_TIMEOUT_SECONDS","3"))
+# Speculative generation: >1 asks for that many SQL candidates concurrently and keeps
+# the cheapest one that passes lint/policy/cost gate. Extra candidates are sampled
+# at SQL_CANDIDATE_TEMPERATURE for diversity. Once one candidate is valid, the rest
+# get SQL_CANDIDATE_GRACE_MS to finish before they are abandoned.
+SQL_CANDIDATES=int(os.getenv("SQL_CANDIDATES","1"))
+SQL_CANDIDATE_TEMPERATURE=float(os.getenv("SQL_CANDIDATE_TEMPERATURE","0.7"))
+SQL_CANDIDATE_GRACE_MS=int(os.getenv("SQL_CANDIDATE_GRACE_MS","300"))
+# Redirect generated aggregates to materialized rollups declared in METRICS_PATH.
+ROLLUP_REWRITE=os.getenv("ROLLUP_REWRITE","1") not in ("0","false","False")
 
 # Index paths
 FAISS_INDEX_PATH=os.getenv("FAISS_INDEX_PATH","./index/faiss.index")
 FAISS_META_PATH=os.getenv("FAISS_META_PATH","./index/meta.json")
+LEXICAL_INDEX_PATH=os.getenv("LEXICAL_INDEX_PATH","./index/lexical.json")
+METRICS_PATH=os.getenv("METRICS_PATH","./data/metrics.yaml")
+QUERY_HISTORY_PATH=os.getenv("QUERY_HISTORY_PATH","./index/query_history.sqlite")
+INGEST_CHECKPOINT_PATH=os.getenv("INGEST_CHECKPOINT_PATH","./index/ingest.checkpoint.json")
+
+# Ingestion pipeline: workers per stage, bounded queue size between stages,
+# and how many written cards between checkpoints.
+INGEST_READERS=int(os.getenv("INGEST_READERS","2"))
+INGEST_BUILDERS=int(os.getenv("INGEST_BUILDERS","8"))
+INGEST_EMBEDDERS=int(os.getenv("INGEST_EMBEDDERS","4"))
+INGEST_QUEUE_SIZE=int(os.getenv("INGEST_QUEUE_SIZE","64"))
+INGEST_CHECKPOINT_EVERY=int(os.getenv("INGEST_CHECKPOINT_EVERY","200"))
+# --samples: concurrent sample queries, per-table time budget, table size above which
+# TABLESAMPLE SYSTEM is used instead of a plain LIMIT, and most-common values per column.
+INGEST_SAMPLE_WORKERS=int(os.getenv("INGEST_SAMPLE_WORKERS","4"))
+SAMPLE_TIME_BUDGET_MS=int(os.getenv("SAMPLE_TIME_BUDGET_MS","2000"))
+SAMPLE_TABLESAMPLE_MIN_ROWS=int(os.getenv("SAMPLE_TABLESAMPLE_MIN_ROWS","10000"))
+SAMPLE_TOP_VALUES=int(os.getenv("SAMPLE_TOP_VALUES","5"))
+
+# Hybrid retrieval: reciprocal-rank-fusion constant, and how many tables a column
+# name may appear in before it stops counting as an exact identifier hit.
+HYBRID_RRF_K=int(os.getenv("HYBRID_RRF_K","60"))
+LEXICAL_MAX_COLUMN_DF=int(os.getenv("LEXICAL_MAX_COLUMN_DF","2"))
+# Raw hits fetched per requested table before column/metric hits are rolled up to tables.
+RETRIEVAL_FANOUT=int(os.getenv("RETRIEVAL_FANOUT","4"))
 
 
 if __name__ == "__main__":
@@ -49,4 +110,5 @@ if __name__ == "__main__":
     print(DSN)
     print(TOP_K)
     print(FAISS_INDEX_PATH)
-    print(FAISS_META_PATH)
\ No newline at end of file
+    print(FAISS_META_PATH)
+    print(LEXICAL_INDEX_PATH)
\ No newline at end of file
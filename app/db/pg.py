@@ -1,28 +1,106 @@
 from __future__ import annotations
 from typing import Any, Dict, List
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
 import os, sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if ROOT not in sys.path:
     sys.path.append(ROOT)
-from app.config import DSN
+from app.config import DB_CANCEL_GRACE_MS, DB_CONNECT_TIMEOUT_SECONDS
+from app.db.router import get_router, connect, schema_of
+from app.deadline import remaining, DeadlineExceeded
+from contextlib import contextmanager
+import threading
 
-engine: Engine = create_engine(DSN, pool_pre_ping=True, future=True)
+def get_engine():
+    """Primary engine, created on first use. Reads should go through app.db.router.connect."""
+    return get_router().primary.engine
+
+def __getattr__(name: str):
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(name)
+
+def _budget_ms(limit_timeout_ms: int) -> int:
+    """Statement timeout capped by the question deadline (app.deadline)."""
+    r = remaining()
+    if r is None:
+        return int(limit_timeout_ms)
+    if r <= 0:
+        raise DeadlineExceeded("question deadline exceeded")
+    return max(1, min(int(limit_timeout_ms), int(r * 1000)))
+
+_cancel_engines: Dict[str, Any] = {}
+
+def _cancel_engine(url):
+    """Non-pooled engine for pg_cancel_backend: the pool may be full of the very statements being cancelled."""
+    key = str(url)
+    if key not in _cancel_engines:
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import NullPool
+        _cancel_engines[key] = create_engine(url, poolclass=NullPool, future=True,
+                                             connect_args={"connect_timeout": DB_CONNECT_TIMEOUT_SECONDS})
+    return _cancel_engines[key]
+
+@contextmanager
+def _guarded(conn, limit_timeout_ms: int):
+    """SET LOCAL statement_timeout for this transaction; past the deadline (+grace), pg_cancel_backend it.
+
+    statement_timeout covers the server side; the watchdog also frees the backend when the
+    client is stuck (network stall, slow fetch). The lock ensures the cancel can only hit
+    this statement, never a later user of the pooled connection.
+    """
+    from sqlalchemy import text
+    budget = _budget_ms(limit_timeout_ms)
+    conn.execute(text(f"SET LOCAL statement_timeout = {budget}"))
+    if remaining() is None:
+        yield; return
+    pid = conn.execute(text("SELECT pg_backend_pid()")).scalar()
+    lock = threading.Lock(); finished = [False]
+    def cancel() -> None:
+        if finished[0]:
+            return
+        try:
+            # connect outside the lock so the caller's cleanup never waits on it
+            with _cancel_engine(conn.engine.url).connect() as c:
+                with lock:
+                    if finished[0]:
+                        return
+                    c.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": pid})
+            print(f"Cancelled backend {pid}: question deadline exceeded")
+        except Exception as e:
+            print(f"pg_cancel_backend({pid}) failed: {e}")
+    timer = threading.Timer((budget + DB_CANCEL_GRACE_MS) / 1000.0, cancel)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    finally:
+        timer.cancel()
+        with lock:
+            finished[0] = True
 
 def run_sql(sql: str, limit_timeout_ms: int = 15000) -> Dict[str, Any]:
-    with engine.connect() as conn:
-        conn.execute(text(f"SET statement_timeout = {int(limit_timeout_ms)}"))
+    from sqlalchemy import text
+    with connect("read", schema_of(sql)) as conn, _guarded(conn, limit_timeout_ms):
         res = conn.execute(text(sql))
         cols = list(res.keys())
         rows = [dict(zip(cols, r)) for r in res.fetchall()]
     return {"columns": cols, "rows": rows}
 
-def explain_sql(sql: str) -> Dict[str, Any]:
-    with engine.connect() as conn:
+def explain_sql(sql: str, limit_timeout_ms: int = 15000) -> Dict[str, Any]:
+    from sqlalchemy import text
+    with connect("read", schema_of(sql)) as conn, _guarded(conn, limit_timeout_ms):
         res = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
         plan = res.fetchone()[0][0]  # EXPLAIN JSON returns array with one dict
     # Extract quick signals
     est_rows = plan.get("Plan", {}).get("Plan Rows", 0)
     total_cost = plan.get("Plan", {}).get("Total Cost", 0.0)
     return {"raw": plan, "est_rows": int(est_rows), "est_cost": float(total_cost)}
+
+def explain_analyze_sql(sql: str, limit_timeout_ms: int = 8000) -> Dict[str, Any]:
+    """EXPLAIN (ANALYZE, BUFFERS): runs the query, returns the plan with actual rows/timings."""
+    from sqlalchemy import text
+    with connect("read", schema_of(sql)) as conn, _guarded(conn, limit_timeout_ms):
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).fetchone()[0][0]
+        conn.rollback()
+    return {"raw": plan, "actual_rows": int(plan.get("Plan", {}).get("Actual Rows", 0)),
+            "runtime_ms": float(plan.get("Execution Time", 0.0))}
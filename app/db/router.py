@@ -0,0 +1,172 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+import threading, time
+import os, sys
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+from app.config import (
+    DSN, REPLICA_DSNS, SCHEMA_ROUTES, REPLICA_MAX_LAG_MS, REPLICA_HEALTH_INTERVAL_SECONDS,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_CONNECT_TIMEOUT_SECONDS,
+)
+
+# Routes connections between the primary, a pool of read replicas and optional
+# per-schema databases.
+#   connect("read", schema)  -> SCHEMA_ROUTES[schema] if set, else a replica; the target
+#                               is the healthy one within REPLICA_MAX_LAG_MS with the fewest
+#                               in-flight connections (lag breaks ties); primary if none qualify
+#   connect("write")         -> always the primary
+# Health and lag are refreshed lazily in the background, at most every
+# REPLICA_HEALTH_INTERVAL_SECONDS.
+
+HEALTH_SQL = """
+  SELECT pg_is_in_recovery(),
+         CASE WHEN NOT pg_is_in_recovery() THEN 0
+              WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+              ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) * 1000, 0)
+         END
+"""
+
+class Target:
+    def __init__(self, dsn: str, primary: bool = False):
+        self.dsn = dsn
+        self.primary = primary
+        self.inflight = 0
+        self.healthy = True
+        self.lag_ms = 0.0
+        self.checked_at = 0.0
+        self.checked = threading.Event()  # set once the first health check has finished
+        self._engine = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    from sqlalchemy import create_engine
+                    # a blackholed host must fail fast, not hang health checks or failover
+                    self._engine = create_engine(self.dsn, pool_pre_ping=True, future=True,
+                                                 pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                                                 connect_args={"connect_timeout": DB_CONNECT_TIMEOUT_SECONDS})
+        return self._engine
+
+    def check(self) -> None:
+        from sqlalchemy import text
+        try:
+            with self.engine.connect() as c:
+                _in_recovery, lag = c.execute(text(HEALTH_SQL)).fetchone()
+            self.healthy, self.lag_ms = True, float(lag or 0)
+        except Exception as e:
+            if self.healthy:
+                print(f"Database {self.name} failed health check: {e}")
+            self.healthy = False
+        self.checked_at = time.time()
+        self.checked.set()
+
+    @property
+    def name(self) -> str:
+        # DSN without credentials, for logs
+        return self.dsn.split("@")[-1]
+
+class Router:
+    def __init__(self, primary: str, replicas: List[str], routes: Dict[str, List[str]]):
+        self.primary = Target(primary, primary=True)
+        self.replicas = [Target(d) for d in replicas]
+        self.routes = {s: [Target(d) for d in dsns] for s, dsns in routes.items()}
+        self._lock = threading.Lock()
+
+    def _refresh(self, targets: List[Target], wait: bool = False) -> None:
+        """Re-check stale targets in background threads; pick() goes on with the last known state.
+
+        A target never checked has no known state yet, so callers wait for its first check
+        (bounded by the connect timeout) instead of trusting the optimistic defaults.
+        """
+        now = time.time(); threads = []
+        with self._lock:
+            stale = [t for t in targets if now - t.checked_at >= REPLICA_HEALTH_INTERVAL_SECONDS]
+            for t in stale:
+                t.checked_at = now  # claim the check so concurrent callers don't stampede
+        for t in stale:
+            th = threading.Thread(target=t.check, name=f"db-health-{t.name}", daemon=True)
+            th.start(); threads.append(th)
+        if wait:
+            for th in threads: th.join()
+        for t in targets:
+            if not t.checked.is_set():
+                t.checked.wait(DB_CONNECT_TIMEOUT_SECONDS + 1)
+
+    def pick(self, kind: str = "read", schema: Optional[str] = None) -> Target:
+        """Choose a target and count a connection against it (release with `inflight -= 1`)."""
+        pool = (self.routes.get(schema or "") or self.replicas) if kind == "read" else []
+        self._refresh(pool)
+        with self._lock:
+            ok = [t for t in pool if t.checked.is_set() and t.healthy and t.lag_ms <= REPLICA_MAX_LAG_MS]
+            if ok:
+                best = min(ok, key=lambda t: (t.inflight, t.lag_ms))
+            elif schema in self.routes and kind == "read":
+                # a routed schema lives only on its own database(s): never fall back to the primary
+                best = min(pool, key=lambda t: (not t.healthy, t.inflight))
+            else:
+                best = self.primary
+            best.inflight += 1
+            return best
+
+    @contextmanager
+    def connect(self, kind: str = "read", schema: Optional[str] = None) -> Iterator[Any]:
+        t = self.pick(kind, schema)
+        try:
+            try:
+                conn = t.engine.connect()
+            except Exception:
+                if t is self.primary or schema in self.routes:
+                    raise
+                # replica went away between health checks: mark it and use the primary
+                t.healthy = False
+                conn = self.primary.engine.connect()
+            with conn:
+                yield conn
+        finally:
+            with self._lock:
+                t.inflight -= 1
+
+    def status(self) -> List[Dict[str, Any]]:
+        targets = [self.primary] + self.replicas + [t for ts in self.routes.values() for t in ts]
+        return [{"db": t.name, "primary": t.primary, "healthy": t.healthy, "lag_ms": t.lag_ms, "inflight": t.inflight} for t in targets]
+
+def _parse_routes(spec: str) -> Dict[str, List[str]]:
+    """'tenant_a=dsn1|dsn2;tenant_b=dsn3' -> {'tenant_a': [dsn1, dsn2], 'tenant_b': [dsn3]}"""
+    out: Dict[str, List[str]] = {}
+    for part in spec.split(";"):
+        if "=" in part:
+            schema, dsns = part.split("=", 1)
+            out[schema.strip()] = [d.strip() for d in dsns.split("|") if d.strip()]
+    return out
+
+_router: Optional[Router] = None
+_router_lock = threading.Lock()
+
+def get_router() -> Router:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = Router(DSN, REPLICA_DSNS, _parse_routes(SCHEMA_ROUTES))
+    return _router
+
+def schema_of(sql: str) -> Optional[str]:
+    """Schema a query's tables live in (used for routing); a routed schema wins over others."""
+    from app.tools.cost_model import tables_in
+    schemas = [t.split(".")[0] for t in tables_in(sql) if "." in t]
+    routed = [s for s in schemas if s in get_router().routes]
+    return (routed or schemas or [None])[0]
+
+def connect(kind: str = "read", schema: Optional[str] = None):
+    return get_router().connect(kind, schema)
+
+if __name__ == "__main__":
+    r = get_router()
+    r._refresh([r.primary] + r.replicas + [t for ts in r.routes.values() for t in ts], wait=True)
+    for s in r.status():
+        print(s)
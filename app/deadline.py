@@ -0,0 +1,48 @@
+from __future__ import annotations
+from typing import Any, Callable, Iterator, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from concurrent.futures import Executor, Future
+import time
+
+# Per-question time budget. The graph sets the deadline (epoch seconds, carried in
+# QAState) around every node; the LLM and DB layers read it from here to cap their
+# own timeouts, so nothing downstream has to thread it through call signatures.
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]) -> Iterator[None]:
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def current() -> Optional[float]:
+    return _deadline.get()
+
+def remaining() -> Optional[float]:
+    """Seconds left, or None when no deadline is set."""
+    d = _deadline.get()
+    return None if d is None else d - time.time()
+
+def expired() -> bool:
+    r = remaining()
+    return r is not None and r <= 0
+
+def bounded(timeout_s: float) -> float:
+    """timeout_s capped by the remaining budget; raises DeadlineExceeded when none is left."""
+    r = remaining()
+    if r is None:
+        return timeout_s
+    if r <= 0:
+        raise DeadlineExceeded("question deadline exceeded")
+    return min(timeout_s, r)
+
+def submit(pool: Executor, fn: Callable[..., Any], *args: Any) -> Future:
+    """Executor.submit that carries the caller's deadline into the worker thread."""
+    return pool.submit(copy_context().run, fn, *args)
@@ -1,5 +1,4 @@
 from __future__ import annotations
-from langgraph.graph import StateGraph, START, END
 import os, sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if ROOT not in sys.path:
@@ -8,8 +7,47 @@ from app.graph.state import QAState
 from app.tools.metadata_tools import retrieve_metadata,propose_join_path
 from app.tools.sql_tools import (
     plan_sql, generate_sql, lint_sql, policy_guard, explain, cost_gate,
-    dry_run_sample, execute, summarize_result
+    dry_run_sample, execute, summarize_result, speculative_sql
 )
+from app.config import SQL_CANDIDATES, QUESTION_TIMEOUT_SECONDS, MAX_GENERATE_ATTEMPTS
+from app.deadline import deadline_scope, DeadlineExceeded
+import functools, time
+
+# ---- Deadline ----
+
+def _timed(fn):
+    """Run a node under the question deadline; mark the state timed out instead of raising.
+
+    Any error raised once the budget is spent (LLM request timeout, statement_timeout,
+    pg_cancel_backend) counts as a timeout, not a failure.
+    """
+    @functools.wraps(fn)
+    def run(state: QAState) -> QAState:
+        deadline = state.setdefault("deadline", time.time() + QUESTION_TIMEOUT_SECONDS)
+        if state.get("timed_out") or time.time() >= deadline:
+            state["timed_out"] = True
+            return state
+        with deadline_scope(deadline):
+            try:
+                return fn(state)
+            except Exception as e:
+                if isinstance(e, DeadlineExceeded) or time.time() >= deadline - 0.05:
+                    state["timed_out"] = True
+                    state.setdefault("evidence", {})["timeout"] = {"node": fn.__name__, "error": str(e)}
+                    return state
+                raise
+    return run
+
+def _then(target: str):
+    def route(state: QAState) -> str:
+        return "give_up" if state.get("timed_out") else target
+    return route
+
+def _retry(state: QAState) -> str:
+    """Loop back to generate unless the deadline or the attempt budget is spent."""
+    if state.get("timed_out") or state.get("attempts", 0) >= MAX_GENERATE_ATTEMPTS:
+        return "give_up"
+    return "generate"
 
 # ---- Nodes ----
 
@@ -42,33 +80,57 @@ def node_plan(state: QAState) -> QAState:
     return state
 
 def node_generate(state: QAState) -> QAState:
-    state["sql"] = generate_sql(state["plan"], "postgres")
+    state["attempts"] = state.get("attempts", 0) + 1
+    if SQL_CANDIDATES > 1:
+        best = speculative_sql(state["plan"], SQL_CANDIDATES, "postgres")
+        state["sql"] = best["sql"]
+        state["speculative"] = best
+        state.setdefault("evidence", {})["candidates"] = {"generated": best["candidates"], "valid": best["valid"]}
+    else:
+        state["sql"] = generate_sql(state["plan"], "postgres")
     return state
 
+def _speculative(state: QAState, key: str):
+    """Result already computed for the current SQL while picking a speculative candidate, if any."""
+    spec = state.get("speculative") or {}
+    if spec.get("sql") == state.get("sql") and spec.get(key) is not None:
+        return spec[key]
+    return None
+
 def node_lint_sql(state: QAState) -> QAState:
-    state["lint"] = lint_sql(state["sql"])
+    state["lint"] = _speculative(state, "lint") or lint_sql(state["sql"])
     return state
 
 def route_after_lint_sql(state: QAState) -> str:
-    return "policy" if state["lint"].get("ok") else "generate"
+    if state.get("timed_out"): return "give_up"
+    return "policy" if state["lint"].get("ok") else _retry(state)
 
 def node_policy(state: QAState) -> QAState:
-    state["policy_ok"] = bool(policy_guard(state["sql"]).get("ok"))
+    spec = _speculative(state, "policy_ok")
+    state["policy_ok"] = spec if spec is not None else bool(policy_guard(state["sql"]).get("ok"))
     return state
 
 def route_after_policy(state: QAState) -> str:
-    return "explain" if state["policy_ok"] else "generate"
+    if state.get("timed_out"): return "give_up"
+    return "explain" if state["policy_ok"] else _retry(state)
 
 def node_explain_sql(state: QAState) -> QAState:
-    state["explain"] = explain(state["sql"])
+    # the speculative check already saw EXPLAIN fail for this SQL: don't run it again
+    failed = _speculative(state, "error")
+    state["explain"] = {"error": failed} if failed else (_speculative(state, "explain") or explain(state["sql"]))
     return state
 
+def route_after_explain_sql(state: QAState) -> str:
+    if state.get("timed_out"): return "give_up"
+    return _retry(state) if state["explain"].get("error") else "cost_gate"
+
 def node_cost_gate(state: QAState) -> QAState:
-    state["gate"] = cost_gate(state["explain"])
+    state["gate"] = _speculative(state, "gate") or cost_gate(state["explain"], state["sql"])
     return state
 
 def route_after_cost_gate(state: QAState) -> str:
-    return "preview" if state["gate"].get("pass") else "generate"
+    if state.get("timed_out"): return "give_up"
+    return "preview" if state["gate"].get("pass") else _retry(state)
 
 def node_dry_run_preview(state: QAState) -> QAState:
     state["preview"] = dry_run_sample(state["sql"])
@@ -76,45 +138,91 @@ def node_dry_run_preview(state: QAState) -> QAState:
     return state
 
 def route_after_dry_run_preview(state: QAState) -> str:
-    return "execute" if state["preview"].get("ok") else "generate"
+    if state.get("timed_out"): return "give_up"
+    return "execute" if state["preview"].get("ok") else _retry(state)
 
 def node_execute(state: QAState) -> QAState:
-    state["result"] = execute(state["sql"])
+    state["result"] = execute(state["sql"], state.get("explain"))
     return state
 
 def node_summarize_answer(state: QAState) -> QAState:
     state["answer"] = summarize_result(state["question"], state["result"], state["retrieved"])
     return state
 
+def _rows_text(data: dict, n: int = 10) -> str:
+    cols = data.get("columns", [])
+    rows = data.get("rows", [])[:n]
+    return f"Columns: {cols}\n" + "\n".join(str([r.get(c) for c in cols]) for r in rows)
+
+def node_give_up(state: QAState) -> QAState:
+    """Best partial answer once the time or attempt budget is spent."""
+    why = "Time budget ran out" if state.get("timed_out") else f"No valid SQL after {state.get('attempts', 0)} attempts"
+    result = state.get("result")
+    preview = (state.get("preview") or {}).get("preview") if (state.get("preview") or {}).get("ok") else None
+    if result:
+        state["answer"] = f"{why} before the answer could be summarized. Raw result:\n{_rows_text(result)}"
+    elif preview:
+        state["answer"] = (f"{why} before the full query finished. Partial answer from a "
+                           f"{len(preview.get('rows', []))}-row preview:\n{_rows_text(preview)}")
+    elif state.get("sql"):
+        state["answer"] = f"{why}. Last SQL tried:\n{state['sql']}"
+    else:
+        state["answer"] = f"{why} before any SQL was produced."
+    return state
+
 # ---- Graph ----
 
-g = StateGraph(QAState)
-g.add_node("retrieve", node_retrieve)
-g.add_node("plan_sql", node_plan)
-# g.add_node("join_hint", node_join_hint)
-g.add_node("generate", node_generate)
-g.add_node("lint_sql", node_lint_sql)
-g.add_node("policy", node_policy)
-g.add_node("explain_sql", node_explain_sql)
-g.add_node("cost_gate", node_cost_gate)
-g.add_node("dry_run_preview", node_dry_run_preview)
-g.add_node("execute", node_execute)
-g.add_node("summarize_answer", node_summarize_answer)
-
-g.add_edge(START, "retrieve")
-g.add_edge("retrieve", "plan_sql")
-# g.add_edge("plan", "join_hint")
-g.add_edge("plan_sql", "generate")
-g.add_edge("generate", "lint_sql")
-g.add_conditional_edges("lint_sql", route_after_lint_sql, {"policy": "policy", "generate": "generate"})
-g.add_conditional_edges("policy", route_after_policy, {"explain": "explain_sql", "generate": "generate"})
-g.add_edge("explain_sql", "cost_gate")
-g.add_conditional_edges("cost_gate", route_after_cost_gate, {"preview": "dry_run_preview", "generate": "generate"})
-g.add_conditional_edges("dry_run_preview", route_after_dry_run_preview, {"execute": "execute", "generate": "generate"})
-g.add_edge("execute", "summarize_answer")
-g.add_edge("summarize_answer", END)
-# g.add_edge("execute", END)
-APP = g.compile()
+# nodes on one generate -> lint_sql -> policy -> explain_sql -> cost_gate -> dry_run_preview pass
+LOOP_NODES = 6
+
+def build_app():
+    from langgraph.graph import StateGraph, START, END
+    g = StateGraph(QAState)
+    g.add_node("retrieve", _timed(node_retrieve))
+    g.add_node("plan_sql", _timed(node_plan))
+    # g.add_node("join_hint", node_join_hint)
+    g.add_node("generate", _timed(node_generate))
+    g.add_node("lint_sql", _timed(node_lint_sql))
+    g.add_node("policy", _timed(node_policy))
+    g.add_node("explain_sql", _timed(node_explain_sql))
+    g.add_node("cost_gate", _timed(node_cost_gate))
+    g.add_node("dry_run_preview", _timed(node_dry_run_preview))
+    g.add_node("execute", _timed(node_execute))
+    g.add_node("summarize_answer", _timed(node_summarize_answer))
+    g.add_node("give_up", node_give_up)
+
+    g.add_edge(START, "retrieve")
+    g.add_conditional_edges("retrieve", _then("plan_sql"), {"plan_sql": "plan_sql", "give_up": "give_up"})
+    # g.add_edge("plan", "join_hint")
+    g.add_conditional_edges("plan_sql", _then("generate"), {"generate": "generate", "give_up": "give_up"})
+    g.add_conditional_edges("generate", _then("lint_sql"), {"lint_sql": "lint_sql", "give_up": "give_up"})
+    g.add_conditional_edges("lint_sql", route_after_lint_sql, {"policy": "policy", "generate": "generate", "give_up": "give_up"})
+    g.add_conditional_edges("policy", route_after_policy, {"explain": "explain_sql", "generate": "generate", "give_up": "give_up"})
+    g.add_conditional_edges("explain_sql", route_after_explain_sql, {"cost_gate": "cost_gate", "generate": "generate", "give_up": "give_up"})
+    g.add_conditional_edges("cost_gate", route_after_cost_gate, {"preview": "dry_run_preview", "generate": "generate", "give_up": "give_up"})
+    g.add_conditional_edges("dry_run_preview", route_after_dry_run_preview, {"execute": "execute", "generate": "generate", "give_up": "give_up"})
+    g.add_conditional_edges("execute", _then("summarize_answer"), {"summarize_answer": "summarize_answer", "give_up": "give_up"})
+    g.add_conditional_edges("summarize_answer", _then(END), {END: END, "give_up": "give_up"})
+    g.add_edge("give_up", END)
+    # g.add_edge("execute", END)
+    # Longest path: retrieve, plan_sql, MAX_GENERATE_ATTEMPTS x (generate .. dry_run_preview),
+    # execute, summarize_answer, give_up. Sized here so every caller gets it, not just the CLI.
+    return g.compile().with_config(recursion_limit=2 + LOOP_NODES * MAX_GENERATE_ATTEMPTS + 3 + 5)
+
+_APP = None
+
+def get_app():
+    """Compiled graph, built on first use so importing this module stays cheap."""
+    global _APP
+    if _APP is None:
+        _APP = build_app()
+    return _APP
+
+def __getattr__(name: str):
+    # backwards compatible `from app.graph.app import APP`
+    if name == "APP":
+        return get_app()
+    raise AttributeError(name)
 
 if __name__ == "__main__":
-    print(APP.get_graph().draw_ascii())
\ No newline at end of file
+    print(get_app().get_graph().draw_ascii())
\ No newline at end of file
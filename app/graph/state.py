@@ -15,3 +15,7 @@ class QAState(TypedDict, total=False):
     result: Dict[str, Any]
     answer: str
     evidence: Dict[str, Any]
+    speculative: Dict[str, Any]
+    deadline: float  # epoch seconds; whole-question budget
+    timed_out: bool
+    attempts: int  # generate passes so far
@@ -0,0 +1,172 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from pathlib import Path
+import json, queue, threading, time
+import os, sys
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+# Staged streaming ingestion:
+#   catalog reader -> card builder -> batched embedder -> index writer
+# Each stage has its own worker pool; stages talk through bounded queues so a slow
+# stage applies back-pressure instead of buffering a whole catalog in memory.
+# The writer (caller's thread) checkpoints periodically so a crashed run resumes
+# from the last completed unit (one table) instead of starting over.
+
+_END = object()
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    p = Path(path)
+    if p.exists():
+        return json.loads(p.read_text(encoding="utf-8"))
+    return {"done": [], "entries": None}
+
+def save_checkpoint(path: str, ckpt: Dict[str, Any]) -> None:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(p.suffix + ".tmp")
+    tmp.write_text(json.dumps(ckpt, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, p)
+
+class _Stage:
+    """`workers` threads draining `q_in`; the last one to finish sends one _END per downstream worker.
+
+    Loops read through `get` (same signature as Queue.get) so the stage knows whether a
+    failed worker already consumed its _END and must not wait for another one.
+    """
+    def __init__(self, name: str, workers: int, q_in: queue.Queue, q_out: queue.Queue, downstream: int,
+                 loop: Callable[[Callable[..., Any], queue.Queue], None], errors: List[BaseException], stop: threading.Event):
+        self.name = name; self.q_in = q_in; self.q_out = q_out; self.downstream = downstream
+        self.loop = loop; self.errors = errors; self.stop = stop
+        self.alive = workers; self.lock = threading.Lock(); self.local = threading.local()
+        self.threads = [threading.Thread(target=self._run, name=f"ingest-{name}-{i}", daemon=True) for i in range(workers)]
+
+    def start(self) -> None:
+        for t in self.threads: t.start()
+
+    def get(self, *args: Any, **kwargs: Any) -> Any:
+        item = self.q_in.get(*args, **kwargs)
+        if item is _END:
+            self.local.ended = True
+        return item
+
+    def _run(self) -> None:
+        try:
+            self.loop(self.get, self.q_out)
+        except BaseException as e:
+            self.errors.append(e); self.stop.set()
+            # keep draining so upstream never blocks on a full queue
+            if not getattr(self.local, "ended", False):
+                while self.get() is not _END:
+                    pass
+        finally:
+            with self.lock:
+                self.alive -= 1
+                last = self.alive == 0
+            if last:
+                for _ in range(self.downstream):
+                    self.q_out.put(_END)
+
+def run_pipeline(
+    sources: List[str],
+    list_units: Callable[[str], Iterable[str]],
+    build: Callable[[str], List[Dict[str, Any]]],
+    embed_batch: Callable[[List[str]], List[Optional[List[float]]]],
+    write: Callable[[List[Dict[str, Any]], List[List[float]]], None],
+    checkpoint: Callable[[Set[str]], None],
+    *,
+    done: Set[str],
+    readers: int = 2,
+    builders: int = 8,
+    embedders: int = 4,
+    queue_size: int = 64,
+    batch_size: int = 64,
+    checkpoint_every: int = 200,
+) -> int:
+    """Stream units (tables) through the stages; returns number of entries written.
+
+    list_units(source) yields unit keys; build(unit) returns entries ({content, ...});
+    embed_batch(texts) returns one vector (or None on failure) per text; write(entries, vecs)
+    appends to the index; checkpoint(done_units) persists progress. Units in `done` are skipped.
+    A unit only counts as done once every one of its entries was embedded and written;
+    if any unit is left incomplete the run raises after checkpointing, so it can resume.
+    """
+    stop = threading.Event(); errors: List[BaseException] = []
+    q_src: queue.Queue = queue.Queue()
+    q_units: queue.Queue = queue.Queue(maxsize=queue_size)
+    q_cards: queue.Queue = queue.Queue(maxsize=queue_size)
+    q_vecs: queue.Queue = queue.Queue(maxsize=queue_size)
+    for s in sources: q_src.put(s)
+    for _ in range(readers): q_src.put(_END)
+
+    def read_loop(get: Callable[..., Any], q_out: queue.Queue) -> None:
+        while (s := get()) is not _END:
+            if stop.is_set(): continue
+            for u in list_units(s):
+                if u not in done:
+                    q_out.put(u)
+
+    def build_loop(get: Callable[..., Any], q_out: queue.Queue) -> None:
+        while (u := get()) is not _END:
+            if stop.is_set(): continue
+            q_out.put((u, build(u)))
+
+    def embed_loop(get: Callable[..., Any], q_out: queue.Queue) -> None:
+        # Batch whole units together so a unit is either fully embedded or not at all.
+        ended = False
+        while not ended:
+            batch: List[Any] = []; n = 0
+            while n < batch_size:
+                try:
+                    item = get(timeout=0.5) if batch else get()
+                except queue.Empty:
+                    break
+                if item is _END:
+                    ended = True; break
+                batch.append(item); n += len(item[1])
+            if not batch:
+                continue
+            texts = [e["content"] for _, entries in batch for e in entries]
+            vecs = embed_batch(texts)
+            i = 0
+            for unit, entries in batch:
+                q_out.put((unit, entries, vecs[i:i+len(entries)]))
+                i += len(entries)
+
+    stages = [
+        _Stage("read", readers, q_src, q_units, builders, read_loop, errors, stop),
+        _Stage("build", builders, q_units, q_cards, embedders, build_loop, errors, stop),
+        _Stage("embed", embedders, q_cards, q_vecs, 1, embed_loop, errors, stop),
+    ]
+    for st in stages: st.start()
+
+    written = 0; since_ckpt = 0; last_ckpt = time.time()
+    completed = set(done); incomplete: Set[str] = set()
+    try:
+        # units already embedded are still written after an upstream failure,
+        # so the final checkpoint keeps as much progress as possible
+        while (item := q_vecs.get()) is not _END:
+            unit, entries, vecs = item
+            if any(v is None for v in vecs):
+                # some cards failed to embed: write none of the unit so a resumed run redoes it
+                # whole instead of duplicating the cards that did embed
+                incomplete.add(unit)
+                continue
+            if entries:
+                write(entries, vecs)
+            written += len(entries); since_ckpt += len(entries)
+            completed.add(unit)
+            if since_ckpt >= checkpoint_every or time.time() - last_ckpt > 60:
+                checkpoint(completed); since_ckpt = 0; last_ckpt = time.time()
+    except BaseException as e:
+        errors.append(e); stop.set()
+        while q_vecs.get() is not _END:
+            pass
+    checkpoint(completed)
+    if errors:
+        raise errors[0]
+    if incomplete:
+        raise RuntimeError(f"{len(incomplete)} units had cards that failed to embed "
+                           f"(e.g. {sorted(incomplete)[0]}); run again to resume")
+    return written
@@ -1,40 +1,50 @@
 from __future__ import annotations
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+import csv, math, threading
+from functools import partial
 import yaml
-from sqlalchemy import text, create_engine
+from sqlalchemy import text
 import os, sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if ROOT not in sys.path:
     sys.path.append(ROOT)
-from app.config import DSN, ALLOWED_SCHEMAS
-from app.vector.faiss_store import add_texts
+from app.config import (
+    ALLOWED_SCHEMAS, METRICS_PATH, INGEST_CHECKPOINT_PATH, INGEST_READERS, INGEST_BUILDERS,
+    INGEST_EMBEDDERS, INGEST_QUEUE_SIZE, INGEST_CHECKPOINT_EVERY, EMBED_BATCH_SIZE,
+    INGEST_SAMPLE_WORKERS, SAMPLE_TIME_BUDGET_MS, SAMPLE_TABLESAMPLE_MIN_ROWS, SAMPLE_TOP_VALUES,
+)
+from app.llm import embed
+from app.db.router import connect
+from app.vector.faiss_store import IndexWriter, all_entries
+from app.vector.lexical_store import build_lexical_index
+from app.ingestion.pipeline import run_pipeline, load_checkpoint, save_checkpoint
 
 # Build small, descriptive "cards" for tables, columns, PK/FK, comments, and metrics.
 
+METRICS_UNIT = "metric://"
+
 def _list_tables(schema:str) -> List[str]:
-    eng = create_engine(DSN, pool_pre_ping=True, future=True)
     q = text("""
       SELECT table_name FROM information_schema.tables
       WHERE table_schema=:s AND table_type='BASE TABLE'
       ORDER BY table_name
     """)
-    with eng.connect() as c:
+    with connect("read", schema) as c:
         return [r[0] for r in c.execute(q, {"s": schema})]
 
 def _columns(schema:str, table:str) -> List[Dict[str,Any]]:
-    eng = create_engine(DSN, pool_pre_ping=True, future=True)
     q = text("""
-      SELECT column_name, data_type, is_nullable, column_default
+      SELECT column_name, data_type, is_nullable, column_default,
+             col_description(to_regclass(quote_ident(table_schema)||'.'||quote_ident(table_name)), ordinal_position)
       FROM information_schema.columns
       WHERE table_schema=:s AND table_name=:t
       ORDER BY ordinal_position
     """)
-    with eng.connect() as c:
+    with connect("read", schema) as c:
         # return [dict(r) for r in c.execute(q, {"s": schema, "t": table})]
-        return [dict(zip(['column_name','data_type','is_nullable','default'], r)) for r in c.execute(q, {"s": schema, "t": table})]
+        return [dict(zip(['column_name','data_type','is_nullable','default','comment'], r)) for r in c.execute(q, {"s": schema, "t": table})]
 
 def _pkeys(schema:str, table:str) -> List[str]:
-    eng = create_engine(DSN, pool_pre_ping=True, future=True)
     q = text("""
       SELECT kcu.column_name
       FROM information_schema.table_constraints tc
@@ -43,11 +53,10 @@ def _pkeys(schema:str, table:str) -> List[str]:
       WHERE tc.constraint_type='PRIMARY KEY' AND tc.table_schema=:s AND tc.table_name=:t
       ORDER BY kcu.ordinal_position
     """)
-    with eng.connect() as c:
+    with connect("read", schema) as c:
         return [r[0] for r in c.execute(q, {"s": schema, "t": table})]
 
 def _fkeys(schema:str, table:str) -> List[Dict[str,str]]:
-    eng = create_engine(DSN, pool_pre_ping=True, future=True)
     q = text("""
       SELECT kcu.column_name AS column, ccu.table_name AS ref_table, ccu.column_name AS ref_column
       FROM information_schema.table_constraints tc
@@ -58,73 +67,227 @@ def _fkeys(schema:str, table:str) -> List[Dict[str,str]]:
       WHERE tc.constraint_type='FOREIGN KEY' AND tc.table_schema=:s AND tc.table_name=:t
       ORDER BY 1
     """)
-    with eng.connect() as c:
-        return [dict(r) for r in c.execute(q, {"s": schema, "t": table})]
+    with connect("read", schema) as c:
+        return [dict(r._mapping) for r in c.execute(q, {"s": schema, "t": table})]
 
 def _table_comment(schema: str, table: str) -> str:
-    eng = create_engine(DSN, pool_pre_ping=True, future=True)
     # Fully-qualify the name; to_regclass('schema.table') → regclass or NULL
     q = text("SELECT obj_description(to_regclass(:tbl))")
     qualified = f"{schema}.{table}"
-    with eng.connect() as c:
+    with connect("read", schema) as c:
         row = c.execute(q, {"tbl": qualified}).fetchone()
         return (row[0] or "") if row and row[0] else ""
 
-def _schema_card(schema:str, table:str) -> str:
-    cols=_columns(schema, table)
-    pks=_pkeys(schema, table)
-    fks=_fkeys(schema, table)
-    desc=_table_comment(schema, table)
-    cols_txt="\n".join([f"- {c['column_name']} ({c['data_type']}, nullable={c['is_nullable']}, default={c['default']})" for c in cols])
+# ---- Value statistics & samples (only when per_table_samples > 0) ----
+
+_schema_stats: Dict[str, Dict[str, Any]] = {}
+_sample_slots = threading.BoundedSemaphore(INGEST_SAMPLE_WORKERS)
+
+def _pg_array(txt: Optional[str]) -> List[str]:
+    """Parse the text form of a Postgres array ('{a,"b c",d}') into strings."""
+    if not txt or len(txt) < 2:
+        return []
+    return next(csv.reader([txt[1:-1]], quotechar='"', escapechar="\\"), [])
+
+def _load_schema_stats(schema:str) -> Dict[str, Any]:
+    """Row estimates and pg_stats for every table in the schema: two queries, not one per column."""
+    q_rows = text("""
+      SELECT c.relname, c.reltuples, c.relpages
+      FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+      WHERE n.nspname=:s AND c.relkind IN ('r','p','m')
+    """)
+    q_stats = text("""
+      SELECT tablename, attname, null_frac, n_distinct,
+             most_common_vals::text, most_common_freqs, histogram_bounds::text
+      FROM pg_stats WHERE schemaname=:s
+    """)
+    rows: Dict[str, float] = {}; pages: Dict[str, int] = {}; cols: Dict[str, Dict[str, Any]] = {}
+    with connect("read", schema) as c:
+        for rel, tuples, npages in c.execute(q_rows, {"s": schema}):
+            rows[rel] = float(tuples or 0); pages[rel] = int(npages or 0)
+        for tbl, att, null_frac, n_distinct, mcv, mcf, hist in c.execute(q_stats, {"s": schema}):
+            n_distinct = float(n_distinct or 0)
+            if n_distinct < 0:  # negative = fraction of rows
+                n_distinct = -n_distinct * max(rows.get(tbl, 0), 0)
+            bounds = _pg_array(hist)
+            cols.setdefault(tbl, {})[att] = {
+                "null_frac": float(null_frac or 0), "n_distinct": int(n_distinct),
+                "top": list(zip(_pg_array(mcv), mcf or [])),
+                "range": (bounds[0], bounds[-1]) if bounds else None,
+            }
+    return {"rows": rows, "pages": pages, "columns": cols}
+
+def _short(v: Any, n: int = 40) -> str:
+    # one line per value: cards are parsed line by line
+    s = " ".join(str(v).split())
+    return s if len(s) <= n else s[:n-3] + "..."
+
+def _sample_rows(schema:str, table:str, n:int) -> List[Dict[str, Any]]:
+    """~n rows via TABLESAMPLE SYSTEM (plain LIMIT for small tables), within SAMPLE_TIME_BUDGET_MS."""
+    rows = _schema_stats.get(schema, {}).get("rows", {}).get(table, 0)
+    pages = _schema_stats.get(schema, {}).get("pages", {}).get(table, 0)
+    try:
+        with _sample_slots, connect("read", schema) as c:
+            prep = c.dialect.identifier_preparer
+            rel = f"{prep.quote(schema)}.{prep.quote(table)}"
+            c.execute(text(f"SET LOCAL statement_timeout = {int(SAMPLE_TIME_BUDGET_MS)}"))
+            out: List[Any] = []; keys: List[str] = []
+            if rows >= SAMPLE_TABLESAMPLE_MIN_ROWS and pages > 0:
+                # SYSTEM picks whole pages: aim for enough pages to hold ~4n rows, never fewer than 4
+                want = max(4, math.ceil(4 * n / max(rows / pages, 1.0)))
+                pct = min(100.0, 100.0 * want / pages)
+                res = c.execute(text(f"SELECT * FROM {rel} TABLESAMPLE SYSTEM ({pct:.6f}) LIMIT {int(n)}"))
+                keys, out = list(res.keys()), res.fetchall()
+            if len(out) < n:
+                # small table, stale stats, or an unlucky sample
+                res = c.execute(text(f"SELECT * FROM {rel} LIMIT {int(n)}"))
+                keys, out = list(res.keys()), res.fetchall()
+            return [dict(zip(keys, r)) for r in out]
+    except Exception as e:
+        print(f"Sampling {schema}.{table} skipped: {e}")
+        return []
+
+def _stats_line(st: Optional[Dict[str, Any]]) -> str:
+    if not st:
+        return ""
+    parts = [f"~{st['n_distinct']} distinct" if st["n_distinct"] else "", f"{round(st['null_frac']*100)}% null" if st["null_frac"] else ""]
+    if st["top"]:
+        parts.append("top: " + ", ".join(f"{_short(v)} ({round(f*100)}%)" for v, f in st["top"][:SAMPLE_TOP_VALUES]))
+    if st["range"]:
+        parts.append(f"range: {_short(st['range'][0])} .. {_short(st['range'][1])}")
+    return "; ".join(p for p in parts if p)
+
+def _table_card(schema:str, table:str, cols:List[Dict[str,Any]], pks:List[str], fks:List[Dict[str,str]], desc:str, samples:List[Dict[str,Any]]=()) -> str:
+    # Column details live in their own cards; keep the table card small even for very wide tables.
+    cols_txt=", ".join(c['column_name'] for c in cols)
     pks_txt=", ".join(pks) if pks else "(none)"
     fks_txt="\n".join([f"- {fk['column']} -> {fk['ref_table']}.{fk['ref_column']}" for fk in fks]) or "(none)"
-    return f"""DB SCHEMA CARD
+    card = f"""DB SCHEMA CARD
 TABLE: {schema}.{table}
-COLUMNS:
-{cols_txt}
+COLUMNS: {cols_txt}
 PRIMARY_KEY: {pks_txt}
 FOREIGN_KEYS:
 {fks_txt}
 DESCRIPTION:
 {desc}
 """.strip()
+    if samples:
+        rows_txt="\n".join(_short(", ".join(f"{k}={_short(v, 24)}" for k, v in r.items()), 300) for r in samples)
+        card += f"\nSAMPLE_ROWS:\n{rows_txt}"
+    return card
+
+def _column_card(schema:str, table:str, col:Dict[str,Any], pks:List[str], fks:List[Dict[str,str]],
+                 stats:Optional[Dict[str,Any]]=None, samples:List[Dict[str,Any]]=()) -> str:
+    refs=[f"{fk['ref_table']}.{fk['ref_column']}" for fk in fks if fk['column']==col['column_name']]
+    extra=""
+    if _stats_line(stats):
+        extra += f"\nSTATS: {_stats_line(stats)}"
+    if samples and not (stats and stats["top"]):
+        # no most-common values (unanalyzed table): show literal examples so formats are visible
+        seen=list(dict.fromkeys(_short(r.get(col['column_name'])) for r in samples if r.get(col['column_name']) is not None))
+        if seen:
+            extra += f"\nEXAMPLES: {', '.join(seen[:SAMPLE_TOP_VALUES])}"
+    return f"""DB COLUMN CARD
+TABLE: {schema}.{table}
+COLUMN: {col['column_name']} ({col['data_type']}, nullable={col['is_nullable']}, default={col['default']})
+PRIMARY_KEY: {"yes" if col['column_name'] in pks else "no"}
+REFERENCES: {", ".join(refs) or "(none)"}
+DESCRIPTION: {col.get('comment') or ""}
+""".strip() + extra
 
-def _metric_cards() -> List[str]:
+def _table_cards(schema:str, table:str, samples:int=0) -> List[Tuple[str,str,Optional[str]]]:
+    """(card, source, parent) for one table card plus one card per column."""
+    cols=_columns(schema, table)
+    pks=_pkeys(schema, table)
+    fks=_fkeys(schema, table)
+    desc=_table_comment(schema, table)
+    rows=_sample_rows(schema, table, samples) if samples > 0 else []
+    stats=_schema_stats.get(schema, {}).get("columns", {}).get(table, {}) if samples > 0 else {}
+    parent=f"schema://{schema}.{table}"
+    out=[(_table_card(schema, table, cols, pks, fks, desc, rows), parent, None)]
+    out+=[(_column_card(schema, table, c, pks, fks, stats.get(c['column_name']), rows), f"column://{schema}.{table}.{c['column_name']}", parent) for c in cols]
+    return out
+
+def _metric_cards() -> List[Tuple[str,str,Optional[str]]]:
     # Optional: load metric catalog (name, definition, table, filters, grain)
     try:
-        data = yaml.safe_load(open("data/metrics.yaml","r",encoding="utf-8"))
+        with open(METRICS_PATH,"r",encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
     except Exception:
         return []
     cards=[]
-    for m in data.get("metrics",[]):
-        cards.append(
+    for m in data.get("metrics") or []:
+        parent = f"schema://{m['table']}" if m.get('table') else None
+        cards.append((
 f"""METRIC CARD
 NAME: {m.get('name')}
 DEFINITION: {m.get('definition')}
 TABLE: {m.get('table')}
 FILTERS: {m.get('filters')}
 GRAIN: {m.get('grain')}
-""".strip())
+""".strip(), f"metric://{m.get('name')}", parent))
     return cards
 
-def ingest_schema_cards(schemas: list[str] = 'public', per_table_samples:int=0) -> int:
-    # samples intentionally ignored here (schema-only). You can extend to add tiny sample rows
-    targets=[]
+def _embed_batch(texts: List[str]) -> List[Optional[List[float]]]:
+    try:
+        return embed(texts)
+    except Exception as e:
+        # fall back to one-by-one so a single bad card doesn't drop the whole batch
+        print(f"Batch embedding of {len(texts)} cards failed ({e}); retrying individually")
+    out: List[Optional[List[float]]] = []
+    for t in texts:
+        try:
+            out.append(embed([t])[0])
+        except Exception as e:
+            print(f"Failed to embed card: {e}")
+            print(f"Text preview: {t[:100]}...")
+            out.append(None)
+    return out
+
+def _list_units(source: str, samples: int = 0) -> List[str]:
+    if source == METRICS_UNIT:
+        return [METRICS_UNIT]
+    if samples > 0:
+        # fetched once per schema here, before any of its tables reach the card builders
+        try:
+            _schema_stats[source] = _load_schema_stats(source)
+        except Exception as e:
+            print(f"pg_stats for schema '{source}' unavailable: {e}")
+    return [f"{source}.{t}" for t in _list_tables(source)]
+
+def _build_unit(unit: str, samples: int = 0) -> List[Dict[str, Any]]:
+    items = _metric_cards() if unit == METRICS_UNIT else _table_cards(*unit.split(".", 1), samples=samples)
+    return [dict({"source": src, "content": card}, **({"parent": parent} if parent else {})) for card, src, parent in items]
+
+def ingest_schema_cards(schemas: list[str] = 'public', per_table_samples:int=0, resume:bool=True) -> int:
     for s in schemas:
         if s not in ALLOWED_SCHEMAS:
             raise ValueError(f"Schema '{s}' not allowed. Update ALLOWED_SCHEMAS in .env")
-        targets += [f"{s}.{t}" for t in _list_tables(s)]
-    cards = []
-    sources = []
-    for full in sorted(set(targets)):
-        s,t = full.split(".",1)
-        cards.append(_schema_card(s,t))
-        sources.append(f"schema://{full}")
-    # metric cards
-    # m_cards = _metric_cards()
-    # cards += m_cards
-    # sources += [f"metric://{i}" for i,_ in enumerate(m_cards)]
-    return add_texts(cards, sources)
+    if not resume and os.path.exists(INGEST_CHECKPOINT_PATH):
+        os.remove(INGEST_CHECKPOINT_PATH)
+    ckpt = load_checkpoint(INGEST_CHECKPOINT_PATH)
+    if ckpt["done"]:
+        print(f"Resuming ingestion: {len(ckpt['done'])} tables already done")
+    if ckpt["entries"] is None:
+        # fresh run: replace the cards of everything being ingested instead of appending duplicates
+        prefixes = tuple(f"{kind}://{s}." for s in schemas for kind in ("schema", "column")) + (METRICS_UNIT,)
+        writer = IndexWriter(replace=lambda src: src.startswith(prefixes))
+    else:
+        writer = IndexWriter(truncate_to=ckpt["entries"])
+
+    def checkpoint(done: set) -> None:
+        writer.save()
+        save_checkpoint(INGEST_CHECKPOINT_PATH, {"schemas": list(schemas), "done": sorted(done), "entries": writer.size})
+
+    added = run_pipeline(
+        list(dict.fromkeys(schemas)) + [METRICS_UNIT],
+        partial(_list_units, samples=per_table_samples), partial(_build_unit, samples=per_table_samples), _embed_batch, writer.add, checkpoint,
+        done=set(ckpt["done"]), readers=INGEST_READERS, builders=INGEST_BUILDERS, embedders=INGEST_EMBEDDERS,
+        queue_size=INGEST_QUEUE_SIZE, batch_size=EMBED_BATCH_SIZE, checkpoint_every=INGEST_CHECKPOINT_EVERY,
+    )
+    os.remove(INGEST_CHECKPOINT_PATH)
+    build_lexical_index(all_entries())
+    return added
 
 
 
@@ -0,0 +1,47 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional
+import importlib
+import threading
+
+# Provider-agnostic LLM entry point. The client for LLM_PROVIDER is built on first
+# use (not at import), then shared by every caller in the process. Register extra
+# providers with register_provider(); swap in a client directly with set_client().
+
+_FACTORIES: Dict[str, Callable[[], Any]] = {
+    "gemini": lambda: importlib.import_module("app.llm.gemini").GeminiClient(),
+    "mock": lambda: importlib.import_module("app.llm.mock").MockClient(),
+}
+_client: Optional[Any] = None
+_lock = threading.Lock()
+
+def register_provider(name: str, factory: Callable[[], Any]) -> None:
+    _FACTORIES[name] = factory
+
+def set_client(client: Optional[Any]) -> None:
+    """Install a client (e.g. a MockClient with canned responses); None resets to LLM_PROVIDER."""
+    global _client
+    with _lock:
+        _client = client
+
+def get_client() -> Any:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                from app.config import LLM_PROVIDER
+                if LLM_PROVIDER not in _FACTORIES:
+                    raise ValueError(f"Unknown LLM_PROVIDER '{LLM_PROVIDER}'. Known: {sorted(_FACTORIES)}")
+                _client = _FACTORIES[LLM_PROVIDER]()
+    return _client
+
+def _timeout(timeout: Optional[float]) -> float:
+    # per-call timeout, never past the current question deadline (app.deadline)
+    from app.config import API_TIMEOUT_SECONDS
+    from app.deadline import bounded
+    return bounded(timeout or API_TIMEOUT_SECONDS)
+
+def embed(texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+    return get_client().embed(texts, timeout=_timeout(timeout))
+
+def generate(prompt: str, temperature: Optional[float] = None, timeout: Optional[float] = None) -> str:
+    return get_client().generate(prompt, temperature=temperature, timeout=_timeout(timeout))
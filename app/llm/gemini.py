@@ -1,53 +1,93 @@
 from __future__ import annotations
-from typing import List
-import google.generativeai as genai
+from typing import Any, Dict, List, Optional
 import os, sys
+import threading
 import time
-from google.api_core import retry
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if ROOT not in sys.path:
     sys.path.append(ROOT)
-from app.config import GOOGLE_API_KEY, GENERATION_MODEL, EMBEDDING_MODEL, API_TIMEOUT_SECONDS, API_MAX_RETRIES, API_RETRY_DELAY
+from app.config import GOOGLE_API_KEY, GENERATION_MODEL, EMBEDDING_MODEL, API_TIMEOUT_SECONDS, API_MAX_RETRIES, API_RETRY_DELAY, EMBED_BATCH_SIZE, GEMINI_TRANSPORT
+from app.deadline import bounded, expired
 
-if not GOOGLE_API_KEY:
-    raise RuntimeError("Set GOOGLE_API_KEY in .env")
+class GeminiClient:
+    """Gemini via google-generativeai, configured on first use.
 
-genai.configure(api_key=GOOGLE_API_KEY)
+    The SDK is imported and configured once per process; GenerativeModel handles are
+    cached per model name so every call reuses the same underlying transport
+    (gRPC channel / keep-alive HTTP session) instead of building a new one.
+    """
+    def __init__(self, api_key: Optional[str] = GOOGLE_API_KEY):
+        if not api_key:
+            raise RuntimeError("Set GOOGLE_API_KEY in .env")
+        import google.generativeai as genai
+        genai.configure(api_key=api_key, transport=GEMINI_TRANSPORT or None)
+        self._genai = genai
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
 
-def embed(texts: List[str]) -> List[List[float]]:
-    # Gemini supports a single content per call; keep it simple & reliable
-    vecs: List[List[float]] = []
-    for t in texts:
+    def _model(self, name: str) -> Any:
+        m = self._models.get(name)
+        if m is None:
+            with self._lock:
+                m = self._models.setdefault(name, self._genai.GenerativeModel(name))
+        return m
+
+    def embed(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        # One request per EMBED_BATCH_SIZE texts (the API accepts a list of contents)
+        vecs: List[List[float]] = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            chunk = texts[start:start+EMBED_BATCH_SIZE]
+            for attempt in range(API_MAX_RETRIES):
+                try:
+                    r = self._genai.embed_content(
+                        model=EMBEDDING_MODEL, 
+                        content=chunk if len(chunk) > 1 else chunk[0],
+                        request_options={"timeout": bounded(timeout or API_TIMEOUT_SECONDS)},
+                    )
+                    # shape: {"embedding":[...]} for one content, {"embedding":[[...], ...]} for a list
+                    vecs += r["embedding"] if len(chunk) > 1 else [r["embedding"]]
+                    break  # Success, exit retry loop
+                except Exception as e:
+                    if attempt == API_MAX_RETRIES - 1 or expired():  # Last attempt / out of time
+                        print(f"Failed to embed text after {API_MAX_RETRIES} attempts: {e}")
+                        raise
+                    print(f"Embedding attempt {attempt + 1} failed: {e}. Retrying in {API_RETRY_DELAY} seconds...")
+                    time.sleep(bounded(API_RETRY_DELAY))  # never sleep past the deadline
+        return vecs
+
+    def generate(self, prompt: str, temperature: Optional[float] = None, timeout: Optional[float] = None) -> str:
+        model = self._model(GENERATION_MODEL)
+        config = {"temperature": temperature} if temperature is not None else None
         for attempt in range(API_MAX_RETRIES):
             try:
-                r = genai.embed_content(
-                    model=EMBEDDING_MODEL, 
-                    content=t
-                )
-                # shape: {"embedding":{"values":[...]}}
-                # print(r)
-                vecs.append(r["embedding"])
-                break  # Success, exit retry loop
+                out = model.generate_content(prompt, generation_config=config, request_options={"timeout": bounded(timeout or API_TIMEOUT_SECONDS)})
+                return (out.text or "").strip()
             except Exception as e:
-                if attempt == API_MAX_RETRIES - 1:  # Last attempt
-                    print(f"Failed to embed text after {API_MAX_RETRIES} attempts: {e}")
+                if attempt == API_MAX_RETRIES - 1 or expired():  # Last attempt / out of time
+                    print(f"Failed to generate content after {API_MAX_RETRIES} attempts: {e}")
                     raise
-                print(f"Embedding attempt {attempt + 1} failed: {e}. Retrying in {API_RETRY_DELAY} seconds...")
-                time.sleep(API_RETRY_DELAY)
-    return vecs
-
-def generate(prompt: str) -> str:
-    model = genai.GenerativeModel(GENERATION_MODEL)
-    for attempt in range(API_MAX_RETRIES):
-        try:
-            out = model.generate_content(prompt)
-            return (out.text or "").strip()
-        except Exception as e:
-            if attempt == API_MAX_RETRIES - 1:  # Last attempt
-                print(f"Failed to generate content after {API_MAX_RETRIES} attempts: {e}")
-                raise
-            print(f"Generation attempt {attempt + 1} failed: {e}. Retrying in {API_RETRY_DELAY} seconds...")
-            time.sleep(API_RETRY_DELAY)
+                print(f"Generation attempt {attempt + 1} failed: {e}. Retrying in {API_RETRY_DELAY} seconds...")
+                time.sleep(bounded(API_RETRY_DELAY))  # never sleep past the deadline
+        return ""
+
+# Module-level helpers kept for scripts that talk to Gemini directly (e.g. test_embedding.py).
+# Application code should go through app.llm, which honours LLM_PROVIDER.
+_client: Optional[GeminiClient] = None
+_client_lock = threading.Lock()
+
+def _default() -> GeminiClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeminiClient()
+    return _client
+
+def embed(texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+    return _default().embed(texts, timeout=timeout)
+
+def generate(prompt: str, temperature: Optional[float] = None, timeout: Optional[float] = None) -> str:
+    return _default().generate(prompt, temperature=temperature, timeout=timeout)
 
 if __name__ == "__main__":
-    print(len(embed(["probe"])[0]))
\ No newline at end of file
+    print(len(embed(["probe"])[0]))
@@ -0,0 +1,35 @@
+from __future__ import annotations
+from typing import Callable, List, Optional
+import hashlib, math
+import os, sys
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+from app.config import MOCK_EMBED_DIM
+
+class MockClient:
+    """Offline stand-in for local runs and tests (LLM_PROVIDER=mock).
+
+    Embeddings are deterministic hashed bag-of-words vectors, so texts sharing words
+    land close together; generate() returns `responder(prompt)` (default: a trivial SELECT).
+    """
+    def __init__(self, responder: Optional[Callable[[str], str]] = None, dim: int = MOCK_EMBED_DIM):
+        self.responder = responder or (lambda prompt: "SELECT 1")
+        self.dim = dim
+        self.calls = {"embed": 0, "generate": 0}
+
+    def _vec(self, text: str) -> List[float]:
+        v = [0.0] * self.dim
+        for w in text.lower().split():
+            h = int.from_bytes(hashlib.blake2b(w.encode("utf-8"), digest_size=8).digest(), "big")
+            v[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        n = math.sqrt(sum(x*x for x in v)) or 1.0
+        return [x/n for x in v]
+
+    def embed(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        self.calls["embed"] += 1
+        return [self._vec(t) for t in texts]
+
+    def generate(self, prompt: str, temperature: Optional[float] = None, timeout: Optional[float] = None) -> str:
+        self.calls["generate"] += 1
+        return self.responder(prompt)
@@ -0,0 +1,167 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+from pathlib import Path
+import hashlib, re, sqlite3, statistics, threading, time
+import os, sys
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+from app.config import QUERY_HISTORY_PATH, COST_HISTORY_WINDOW, DEFAULT_MS_PER_COST
+
+# Execution-feedback cost model.
+# Postgres' EXPLAIN estimates are often off by orders of magnitude on skewed tables,
+# so the cost gate predicts latency in milliseconds from what actually happened:
+#   1. same query shape (fingerprint) ran before -> median observed runtime, scaled by
+#                           current est_cost / that run's est_cost
+#   2. tables ran before -> est_cost * observed ms-per-cost-unit for those tables
+#   3. nothing known     -> est_cost * DEFAULT_MS_PER_COST, scaled by any observed
+#                           row misestimation on the scanned tables (EXPLAIN ANALYZE samples)
+
+SCHEMA_QUAL = re.compile(r"\b([a-zA-Z_][\w]*)\.([a-zA-Z_][\w]*)\b")
+
+_lock = threading.Lock()
+_initialized = False
+
+@contextmanager
+def _db() -> Iterator[sqlite3.Connection]:
+    global _initialized
+    Path(QUERY_HISTORY_PATH).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(QUERY_HISTORY_PATH, timeout=5)
+    try:
+        if not _initialized:
+            with _lock:
+                conn.executescript("""
+                  CREATE TABLE IF NOT EXISTS executions (
+                    ts REAL, fingerprint TEXT, tables TEXT, est_rows REAL, est_cost REAL,
+                    actual_rows REAL, runtime_ms REAL);
+                  CREATE INDEX IF NOT EXISTS executions_fp ON executions(fingerprint);
+                  CREATE TABLE IF NOT EXISTS scans (
+                    ts REAL, tbl TEXT, est_rows REAL, actual_rows REAL);
+                  CREATE INDEX IF NOT EXISTS scans_tbl ON scans(tbl);
+                """)
+                _initialized = True
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+def fingerprint(sql: str) -> str:
+    """Literal-insensitive hash of the query shape."""
+    try:
+        import sqlglot
+        from sqlglot import exp
+        tree = sqlglot.parse_one(sql, read="postgres")
+        tree = tree.transform(lambda n: exp.Placeholder() if isinstance(n, exp.Literal) else n)
+        norm = tree.sql(dialect="postgres")
+    except Exception:
+        norm = re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", "?", sql)
+    norm = re.sub(r"\s+", " ", norm).strip().lower()
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()[:16]
+
+def tables_in(sql: str) -> List[str]:
+    """Schema-qualified tables referenced by the query."""
+    try:
+        import sqlglot
+        from sqlglot import exp
+        names = {f"{t.db}.{t.name}" if t.db else t.name for t in sqlglot.parse_one(sql, read="postgres").find_all(exp.Table)}
+    except Exception:
+        names = {f"{s}.{t}" for s, t in SCHEMA_QUAL.findall(sql)}
+    return sorted(n.lower() for n in names)
+
+def record_execution(sql: str, explain: Optional[Dict[str, Any]], actual_rows: Optional[int], runtime_ms: float) -> None:
+    """actual_rows=None marks a failed run (timeout, cancel, error); runtime_ms is then a lower bound."""
+    explain = explain or {}
+    try:
+        with _db() as c:
+            c.execute("INSERT INTO executions VALUES (?,?,?,?,?,?,?)", (
+                time.time(), fingerprint(sql), ",".join(tables_in(sql)),
+                explain.get("est_rows"), explain.get("est_cost"), actual_rows, runtime_ms))
+    except Exception as e:
+        print(f"Failed to record query history: {e}")
+
+# nodes that consume their whole input before emitting a row: a Limit above them
+# doesn't cut the scans below short
+BLOCKING = {"Aggregate", "Sort", "Hash", "Materialize", "WindowAgg", "SetOp"}
+
+def _walk_scans(node: Dict[str, Any], limited: bool = False) -> Iterator[Tuple[Dict[str, Any], bool]]:
+    """(scan node, stopped early by a Limit above it with no blocking node in between)."""
+    ntype = node.get("Node Type", "")
+    if ntype == "Limit":
+        limited = True
+    elif ntype in BLOCKING:
+        limited = False
+    if "Relation Name" in node:
+        yield node, limited
+    for child in node.get("Plans", []) or []:
+        yield from _walk_scans(child, limited)
+
+def _scan_nodes(node: Dict[str, Any]) -> Iterator[Tuple[str, float, float]]:
+    """(table, estimated rows, actual rows) per scan, both per loop.
+
+    Scans a Limit stopped early (actual < estimate only because nobody asked for more
+    rows) are skipped; they say nothing about the planner's estimate.
+    """
+    for scan, limited in _walk_scans(node):
+        if "Actual Rows" in scan and float(scan.get("Actual Loops", 1)) > 0 and not limited:
+            tbl = f"{scan.get('Schema', 'public')}.{scan['Relation Name']}".lower()
+            yield tbl, float(scan.get("Plan Rows", 0)), float(scan["Actual Rows"])
+
+def record_analyze(plan: Dict[str, Any]) -> None:
+    """Store per-table estimated vs. actual rows from an EXPLAIN (ANALYZE, FORMAT JSON) plan."""
+    try:
+        rows = [(time.time(), t, e, a) for t, e, a in _scan_nodes(plan.get("Plan", {}))]
+        if rows:
+            with _db() as c:
+                c.executemany("INSERT INTO scans VALUES (?,?,?,?)", rows)
+    except Exception as e:
+        print(f"Failed to record EXPLAIN ANALYZE sample: {e}")
+
+def record_probe(sql: str, explain: Optional[Dict[str, Any]], plan: Dict[str, Any]) -> None:
+    """Learn from EXPLAIN ANALYZE of a LIMIT probe of `sql` (e.g. a query the gate rejected).
+
+    Scan misestimates are always kept; the runtime is recorded as a run of `sql` only when
+    no scan was cut short by the LIMIT, i.e. the probe did the same work as the full query.
+    """
+    record_analyze(plan)
+    root = plan.get("Plan", {})
+    if not any(limited for _, limited in _walk_scans(root)):
+        record_execution(sql, explain, int(root.get("Actual Rows", 0)), float(plan.get("Execution Time", 0.0)))
+
+def _median(xs: List[float]) -> Optional[float]:
+    return statistics.median(xs) if xs else None
+
+def predict_ms(sql: Optional[str], explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Predicted runtime in ms plus the basis used ("fingerprint" | "tables" | "default")."""
+    est_cost = float(explain.get("est_cost", 0) or 0)
+    est_rows = float(explain.get("est_rows", 0) or 0)
+    if not sql:
+        return {"ms": est_cost * DEFAULT_MS_PER_COST, "rows": est_rows, "basis": "default"}
+    tables = tables_in(sql)
+    try:
+        with _db() as c:
+            # fingerprints ignore literals (a one-day and an all-time range look alike), so
+            # scale each past runtime by how the current plan's cost compares to that run's
+            fp_runs = [ms * (max(est_cost, 1.0) / max(cost, 1.0) if est_cost and cost else 1.0) for ms, cost in c.execute(
+                "SELECT runtime_ms, est_cost FROM executions WHERE fingerprint=? ORDER BY ts DESC LIMIT ?",
+                (fingerprint(sql), COST_HISTORY_WINDOW))]
+            ms_per_cost: List[float] = []; row_factor: List[float] = []
+            for t in tables:
+                per = [ms / max(cost, 1.0) for ms, cost in c.execute(
+                    "SELECT runtime_ms, est_cost FROM executions WHERE (','||tables||',') LIKE ? AND est_cost IS NOT NULL "
+                    "ORDER BY ts DESC LIMIT ?", (f"%,{t},%", COST_HISTORY_WINDOW))]
+                if per: ms_per_cost.append(_median(per))
+                f = [max(a, 1.0) / max(e, 1.0) for e, a in c.execute(
+                    "SELECT est_rows, actual_rows FROM scans WHERE tbl=? ORDER BY ts DESC LIMIT ?", (t, COST_HISTORY_WINDOW))]
+                if f: row_factor.append(_median(f))
+    except Exception as e:
+        print(f"Query history unavailable: {e}")
+        fp_runs, ms_per_cost, row_factor = [], [], []
+    # worst table wins: a single badly-estimated table dominates the query
+    factor = max(row_factor) if row_factor else 1.0
+    rows = est_rows * factor
+    if fp_runs:
+        return {"ms": _median(fp_runs), "rows": rows, "basis": "fingerprint"}
+    if ms_per_cost:
+        return {"ms": est_cost * max(ms_per_cost), "rows": rows, "basis": "tables"}
+    return {"ms": est_cost * DEFAULT_MS_PER_COST * factor, "rows": rows, "basis": "default"}
@@ -1,26 +1,73 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Set, Deque
+from typing import List, Dict, Any, Set, Deque, Tuple
 from collections import deque, defaultdict
-from sqlalchemy import text, create_engine
 import os, sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if ROOT not in sys.path:
     sys.path.append(ROOT)
-from app.config import DSN, ALLOWED_SCHEMAS, TOP_K
-from app.vector.faiss_store import search as vec_search
-import yaml
+from app.config import ALLOWED_SCHEMAS, TOP_K, HYBRID_RRF_K, RETRIEVAL_FANOUT
+from app.db.router import connect
+from app.vector.faiss_store import search_entries as vec_search
+from app.vector.lexical_store import lexical_search, exact_identifiers, get_card
+
+# 1) retrieve_metadata: hybrid BM25 + vector search over table/column/metric cards
+def _rrf(*rankings: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], float]]:
+    """Reciprocal rank fusion keyed by card source."""
+    scores: Dict[str, float] = defaultdict(float)
+    entries: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, e in enumerate(ranking):
+            scores[e["source"]] += 1.0 / (HYBRID_RRF_K + rank + 1)
+            entries.setdefault(e["source"], e)
+    return [(entries[s], scores[s]) for s in sorted(scores, key=scores.get, reverse=True)]
+
+def _column_line(card: str) -> str:
+    """Compact one-line form of a column card for the MATCHED_COLUMNS section."""
+    f = {ln.split(":", 1)[0]: ln.split(":", 1)[1].strip() for ln in card.splitlines() if ":" in ln}
+    line = f"- {f.get('COLUMN', '')}"
+    if f.get("PRIMARY_KEY") == "yes": line += " PK"
+    if f.get("REFERENCES") not in (None, "", "(none)"): line += f" -> {f['REFERENCES']}"
+    if f.get("DESCRIPTION"): line += f" -- {f['DESCRIPTION']}"
+    if f.get("STATS"): line += f" [{f['STATS']}]"
+    if f.get("EXAMPLES"): line += f" [e.g. {f['EXAMPLES']}]"
+    return line
+
+def _aggregate(hits: List[Tuple[Dict[str, Any], float]], k: int) -> List[str]:
+    """Roll column hits up to their parent table; return k table/metric contexts."""
+    groups: Dict[str, Dict[str, Any]] = {}
+    for e, score in hits:
+        src = e["source"]
+        key = e.get("parent") if src.startswith("column://") and e.get("parent") else src
+        g = groups.setdefault(key, {"score": 0.0, "card": None, "columns": []})
+        g["score"] += score
+        if key == src:
+            g["card"] = e["content"]
+        else:
+            g["columns"].append(e["content"])
+    out: List[str] = []
+    for key in sorted(groups, key=lambda s: groups[s]["score"], reverse=True)[:k]:
+        g = groups[key]
+        card = g["card"] or get_card(key) or ""
+        if g["columns"]:
+            card = (card + "\nMATCHED_COLUMNS:\n" + "\n".join(_column_line(c) for c in g["columns"])).strip()
+        out.append(card)
+    return out
 
-# 1) retrieve_metadata: vector search over schema/metric cards
 def retrieve_metadata(query: str, k: int = TOP_K) -> List[str]:
-    return vec_search(query, k)
+    n = k * RETRIEVAL_FANOUT
+    lex = lexical_search(query, n)
+    # Question names tables/metrics/columns verbatim: BM25 is enough, skip the embedding call.
+    if lex and exact_identifiers(query):
+        return _aggregate([(e, e["score"]) for e in lex], k)
+    return _aggregate(_rrf(lex, vec_search(query, n)), k)
 
 # 2) get_schema_objects: live snapshot (tables, columns, pk/fk)
 def get_schema_objects(schema: str) -> Dict[str, Any]:
     if schema not in ALLOWED_SCHEMAS:
         return {"error": f"Schema '{schema}' not allowed"}
-    eng = create_engine(DSN, pool_pre_ping=True, future=True)
+    from sqlalchemy import text
     out: Dict[str, Any] = {"schema": schema, "tables": {}}
-    with eng.connect() as c:
+    with connect("read", schema) as c:
         tables = [r[0] for r in c.execute(text("""
           SELECT table_name FROM information_schema.tables
           WHERE table_schema=:s AND table_type='BASE TABLE' ORDER BY table_name
@@ -0,0 +1,297 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date
+import os, sys, re
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+from app.config import METRICS_PATH
+
+# Aggregate-aware rewriting onto materialized rollups declared under `rollups:` in
+# data/metrics.yaml. A generated GROUP BY query over a rollup's source table is
+# redirected to the smallest rollup that has every dimension, time grain and measure
+# it needs; anything the rewriter can't prove equivalent is left untouched.
+#
+# Rollup columns: <period_column> = date_trunc(grain, time_column), each dimension
+# as-is, and each measure under its own name (e.g. revenue_sum = sum(amount)).
+# Re-aggregation: sum -> sum, count -> coalesce(sum, 0), min -> min, max -> max,
+# avg(x) -> sum(sum(x)) / sum(count(x)) when both measures exist.
+
+GRAINS = ["hour", "day", "week", "month", "quarter", "year"]
+# grain -> coarser grains that can be derived from it by another date_trunc
+DERIVABLE = {
+    "hour": {"hour", "day", "week", "month", "quarter", "year"},
+    "day": {"day", "week", "month", "quarter", "year"},
+    "week": {"week"},
+    "month": {"month", "quarter", "year"},
+    "quarter": {"quarter", "year"},
+    "year": {"year"},
+}
+
+_cache: Dict[str, Any] = {"mtime": None, "rollups": []}
+
+def load_rollups() -> List[Dict[str, Any]]:
+    """Rollup registry from METRICS_PATH (cached until the file changes)."""
+    import yaml
+    try:
+        mtime = os.path.getmtime(METRICS_PATH)
+    except OSError:
+        return []
+    if _cache["mtime"] != mtime:
+        with open(METRICS_PATH, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        rollups = []
+        for r in data.get("rollups") or []:
+            r = dict(r)
+            r.setdefault("dimensions", [])
+            r.setdefault("measures", {})
+            r.setdefault("period_column", "period")
+            r["grain"] = (r.get("grain") or "day").lower() if r.get("time_column") else None
+            rollups.append(r)
+        _cache.update(mtime=mtime, rollups=rollups)
+    return _cache["rollups"]
+
+def _size_key(r: Dict[str, Any]) -> Tuple[float, int, int]:
+    # declared row estimate first, else fewer dimensions / coarser grain = smaller
+    grain_rank = -GRAINS.index(r["grain"]) if r.get("grain") else -len(GRAINS)
+    return (float(r.get("rows", float("inf"))), len(r["dimensions"]), grain_rank)
+
+# ---------- rewriting ----------
+
+def _unqualified(node):
+    from sqlglot import exp
+    node = node.copy()
+    for c in node.find_all(exp.Column):
+        c.set("table", None)
+    return node
+
+def _measure_key(agg) -> Optional[Tuple[str, str]]:
+    """(aggregate, normalized argument) for sum/count/min/max nodes; None otherwise."""
+    from sqlglot import exp
+    kinds = {exp.Sum: "sum", exp.Count: "count", exp.Min: "min", exp.Max: "max"}
+    kind = next((k for t, k in kinds.items() if type(agg) is t), None)
+    if kind is None:
+        return None
+    arg = agg.this
+    if isinstance(arg, exp.Distinct):
+        return None
+    if arg is None or isinstance(arg, exp.Star):
+        return (kind, "*")
+    return (kind, _unqualified(arg).sql(dialect="postgres").lower())
+
+def _measures(r: Dict[str, Any]) -> Dict[Tuple[str, str], str]:
+    import sqlglot
+    out = {}
+    for col, expr in r["measures"].items():
+        key = _measure_key(sqlglot.parse_one(str(expr), read="postgres"))
+        if key:
+            out[key] = col
+    return out
+
+def _trunc_parts(node) -> Optional[Tuple[str, Any]]:
+    """('month', <column>) for date_trunc('month', col) in any of sqlglot's spellings."""
+    from sqlglot import exp
+    trunc_types = tuple(t for t in (getattr(exp, "DateTrunc", None), getattr(exp, "TimestampTrunc", None)) if t)
+    if isinstance(node, trunc_types):
+        unit = node.args.get("unit")
+        name = unit.name if unit is not None else ""
+        return (name.lower().strip("'"), node.this)
+    if isinstance(node, exp.Anonymous) and node.name.lower() == "date_trunc" and len(node.expressions) == 2:
+        return (node.expressions[0].name.lower(), node.expressions[1])
+    return None
+
+def _aligned(literal: str, grain: str) -> bool:
+    """Is a date literal on a `grain` boundary (so `col >= lit` means the same on the rollup)?"""
+    if grain == "hour":
+        return bool(re.fullmatch(r"\d{4}-\d{2}-\d{2}( \d{2}(:00(:00)?)?)?", literal))
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", literal):
+        return False
+    d = date.fromisoformat(literal)
+    return {
+        "day": True,
+        "week": d.weekday() == 0,
+        "month": d.day == 1,
+        "quarter": d.day == 1 and d.month in (1, 4, 7, 10),
+        "year": d.day == 1 and d.month == 1,
+    }[grain]
+
+def _date_literal(node) -> Optional[str]:
+    from sqlglot import exp
+    if isinstance(node, exp.Cast):
+        node = node.this
+    if isinstance(node, exp.Literal) and node.is_string:
+        return node.this
+    return None
+
+def _rewrite_with(tree, table, r: Dict[str, Any]):
+    """Rewritten copy of `tree` against rollup r, or None if r can't answer it."""
+    from sqlglot import exp
+    measures = _measures(r)
+    dims = {d.lower() for d in r["dimensions"]}
+    tcol = (r.get("time_column") or "").lower()
+    period = r["period_column"]
+    grain = r.get("grain")
+    failed: List[str] = []
+
+    def col(name: str):
+        c = exp.column(name, table=table.alias_or_name if table.alias else None)
+        c.meta["rollup"] = True  # introduced by the rewrite, known to exist on the rollup
+        return c
+
+    def swap(node):
+        if failed:
+            return node
+        if isinstance(node, exp.Avg):
+            arg = node.this
+            s = measures.get(("sum", _unqualified(arg).sql(dialect="postgres").lower())) if arg is not None else None
+            c = measures.get(("count", _unqualified(arg).sql(dialect="postgres").lower())) if arg is not None else None
+            if not (s and c):
+                failed.append("avg"); return node
+            return exp.Div(
+                this=exp.Cast(this=exp.Sum(this=col(s)), to=exp.DataType.build("numeric")),
+                expression=exp.Nullif(this=exp.Sum(this=col(c)), expression=exp.Literal.number(0)),
+            )
+        key = _measure_key(node)
+        if key is not None:
+            m = measures.get(key)
+            if not m:
+                failed.append(f"{key[0]}({key[1]})"); return node
+            if key[0] == "count":
+                resum = exp.Sum(this=col(m))
+                resum.meta["count"] = True  # wrapped in COALESCE(..., 0) below
+                return resum
+            return exp.Sum(this=col(m)) if key[0] == "sum" else type(node)(this=col(m))
+        if isinstance(node, exp.AggFunc):
+            failed.append(node.key); return node
+        parts = _trunc_parts(node)
+        if parts and isinstance(parts[1], exp.Column) and parts[1].name.lower() == tcol:
+            if not grain or parts[0] not in DERIVABLE[grain]:
+                failed.append(f"date_trunc({parts[0]})"); return node
+            return exp.Anonymous(this="date_trunc", expressions=[exp.Literal.string(parts[0]), col(period)])
+        if isinstance(node, (exp.GTE, exp.LT)) and grain:
+            left, right = node.this, node.expression
+            if isinstance(left, exp.Column) and left.name.lower() == tcol:
+                lit = _date_literal(right)
+                if lit is not None and _aligned(lit, grain):
+                    return type(node)(this=col(period), expression=right.copy())
+        return node
+
+    out = tree.copy().transform(swap)
+    if failed:
+        return None
+    # count() is 0 over no rows, SUM() of counts is NULL: keep the original result
+    for resum in list(out.find_all(exp.Sum)):
+        if resum.meta.get("count"):
+            agg = resum.parent if isinstance(resum.parent, exp.Filter) else resum
+            agg.replace(exp.Coalesce(this=agg.copy(), expressions=[exp.Literal.number(0)]))
+    if out.find(exp.Star):
+        return None
+    # Every remaining user column must exist on the rollup: a dimension, or a SELECT alias
+    # where Postgres resolves output names (GROUP BY / HAVING / ORDER BY). WHERE sees only
+    # input columns, so an alias there (e.g. `sum(amount) AS amount ... WHERE amount > 5`)
+    # is the raw source column and can't be answered from the rollup.
+    aliases = {a.alias.lower() for a in out.expressions if isinstance(a, exp.Alias)} - {tcol}
+    for c in out.find_all(exp.Column):
+        if c.meta.get("rollup") or c.name.lower() in dims:
+            continue
+        clause = c.find_ancestor(exp.Where, exp.Group, exp.Having, exp.Order)
+        if c.name.lower() in aliases and isinstance(clause, (exp.Group, exp.Having, exp.Order)):
+            continue
+        return None
+    new_table = exp.to_table(r["name"])
+    if table.alias:
+        new_table.set("alias", table.args.get("alias"))
+    out.find(exp.Table).replace(new_table)
+    return out
+
+def rewrite_to_rollup(sql: str) -> Tuple[str, Optional[str]]:
+    """(sql, rollup name) - the query redirected to the smallest matching rollup, or unchanged."""
+    rollups = load_rollups()
+    if not rollups:
+        return sql, None
+    try:
+        import sqlglot
+        from sqlglot import exp
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except Exception:
+        return sql, None
+    if not isinstance(tree, exp.Select) or tree.args.get("joins") or tree.args.get("with") or tree.args.get("distinct"):
+        return sql, None
+    tables = list(tree.find_all(exp.Table))
+    if len(tables) != 1 or tree.find(exp.Subquery) or tree.find(exp.Window):
+        return sql, None
+    if not tree.find(exp.AggFunc):
+        return sql, None  # row-level query: nothing to pre-aggregate
+    t = tables[0]
+    full = f"{t.db}.{t.name}".lower() if t.db else t.name.lower()
+    for r in sorted(rollups, key=_size_key):
+        if str(r.get("source", "")).lower() != full:
+            continue
+        out = _rewrite_with(tree, t, r)
+        if out is not None:
+            return out.sql(dialect="postgres"), r["name"]
+    return sql, None
+
+# ---------- tooling ----------
+
+def rollup_ddl(r: Dict[str, Any]) -> List[str]:
+    """CREATE MATERIALIZED VIEW + unique index (needed for REFRESH ... CONCURRENTLY)."""
+    cols, keys = [], []
+    if r.get("time_column"):
+        cols.append(f"date_trunc('{r['grain']}', {r['time_column']}) AS {r['period_column']}")
+        keys.append(r["period_column"])
+    cols += list(r["dimensions"]); keys += list(r["dimensions"])
+    cols += [f"{expr} AS {name}" for name, expr in r["measures"].items()]
+    group = ", ".join(str(i + 1) for i in range(len(keys)))
+    stmts = [f"CREATE MATERIALIZED VIEW IF NOT EXISTS {r['name']} AS\nSELECT {', '.join(cols)}\nFROM {r['source']}"
+             + (f"\nGROUP BY {group}" if group else "")]
+    if keys:
+        idx = r["name"].split(".")[-1] + "_key"
+        stmts.append(f"CREATE UNIQUE INDEX IF NOT EXISTS {idx} ON {r['name']} ({', '.join(keys)})")
+    return stmts
+
+def _select(names: Optional[List[str]]) -> List[Dict[str, Any]]:
+    rollups = load_rollups()
+    if not names:
+        return rollups
+    picked = [r for r in rollups if r["name"] in names or r["name"].split(".")[-1] in names]
+    missing = set(names) - {r["name"] for r in picked} - {r["name"].split(".")[-1] for r in picked}
+    if missing:
+        raise ValueError(f"Unknown rollups: {sorted(missing)}")
+    return picked
+
+def create_rollups(names: Optional[List[str]] = None) -> List[str]:
+    """Create the declared materialized views on the primary (replicas get them via replication)."""
+    from sqlalchemy import text
+    from app.db.router import connect
+    done = []
+    for r in _select(names):
+        with connect("write") as c:
+            for stmt in rollup_ddl(r):
+                c.execute(text(stmt))
+            c.commit()
+        done.append(r["name"])
+    return done
+
+def refresh_rollups(names: Optional[List[str]] = None) -> List[str]:
+    """REFRESH MATERIALIZED VIEW, concurrently (readers not blocked) when the unique index allows."""
+    from sqlalchemy import text
+    from app.db.router import connect
+    done = []
+    for r in _select(names):
+        with connect("write") as c:
+            try:
+                c.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {r['name']}"))
+                c.commit()
+            except Exception as e:
+                # first refresh of an unpopulated view, or no usable unique index
+                c.rollback()
+                print(f"Concurrent refresh of {r['name']} failed ({e}); refreshing with lock")
+                c.execute(text(f"REFRESH MATERIALIZED VIEW {r['name']}"))
+                c.commit()
+        done.append(r["name"])
+    return done
+
+if __name__ == "__main__":
+    for r in load_rollups():
+        print("\n".join(rollup_ddl(r)))
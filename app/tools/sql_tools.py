@@ -1,24 +1,25 @@
 from __future__ import annotations
 from typing import Any, Dict, List, Optional
-import json, re
-import sqlglot 
-from sqlalchemy import text, create_engine
-from sqlglot import parse_one
+import json, random, re, time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 import os, sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if ROOT not in sys.path:
     sys.path.append(ROOT)
-from app.llm.gemini import generate
-from app.config import DSN, ALLOWED_SCHEMAS
-from app.db.pg import run_sql, explain_sql
-from app.config import MAX_SQL_ROWS, MAX_EST_ROWS, MAX_EST_COST, ALLOWED_SCHEMAS
+from app.llm import generate
+from app.db.pg import run_sql, explain_sql, explain_analyze_sql
+from app.db.router import connect
+from app.config import MAX_SQL_ROWS, MAX_EST_ROWS, MAX_QUERY_MS, ALLOWED_SCHEMAS, SQL_CANDIDATES, SQL_CANDIDATE_TEMPERATURE, SQL_CANDIDATE_GRACE_MS, EXPLAIN_ANALYZE_SAMPLE_RATE, ROLLUP_REWRITE
+from app.deadline import submit, DeadlineExceeded
+from app.tools.rollup_tools import rewrite_to_rollup
+from app.tools.cost_model import predict_ms, record_execution, record_analyze, record_probe
 
 FORBIDDEN = {"INSERT","UPDATE","DELETE","MERGE","CREATE","ALTER","DROP","TRUNCATE","GRANT","REVOKE"}
 SCHEMA_QUAL = re.compile(r"\b([a-zA-Z_][\w]*)\.([a-zA-Z_][\w]*)\b")
 
 # --------- PLANNING & GENERATION ---------
 def load_metadata_json():
-    eng = create_engine(DSN, pool_pre_ping=True, future=True)
+    from sqlalchemy import text
     q = text("""
       WITH
   params AS (
@@ -110,7 +111,7 @@ FROM (
   GROUP BY c.table_name
 ) t;
     """)
-    with eng.connect() as c:
+    with connect("read", "public") as c:
         val = c.execute(q).scalar_one()
         if isinstance(val, str):
             val = json.loads(val)
@@ -120,11 +121,14 @@ FROM (
 
 def plan_sql(nl_question: str, retrieved_context: List[str]) -> Dict[str, Any]:
     """LLM makes a JSON plan of tables/joins/filters/etc based on schema+metric cards."""
-    ctx = load_metadata_json() #"\n---\n".join(retrieved_context[:5])
-    # ctx = "\n---\n".join(retrieved_context)
+    # retrieved table/metric cards (with MATCHED_COLUMNS) keep the prompt small; the full
+    # catalog dump is only a fallback when nothing was retrieved (e.g. no index built yet)
+    ctx = "\n---\n".join(retrieved_context) if retrieved_context else load_metadata_json()
     prompt = f"""
 You are a data analyst. From the Context, plan a SQL query in JSON. Only return JSON.
 JSON fields: tables, joins (list of objects {{left,right,type}}), select, filters, group_by, order_by.
+In filters, write literal values exactly as they appear in the Context's STATS (top values, range),
+EXAMPLES and SAMPLE_ROWS lines: same spelling, case and date/number format. Don't guess enum values.
 Context:
 {ctx}
 
@@ -140,22 +144,26 @@ Return JSON only.
     except Exception:
         return {"tables": [], "joins": [], "select": [], "filters": [], "group_by": [], "order_by": [], "metric_refs": []}
 
-def generate_sql(plan: Dict[str, Any], dialect: str = "postgres") -> str:
+def generate_sql(plan: Dict[str, Any], dialect: str = "postgres", temperature: Optional[float] = None) -> str:
     """LLM turns plan into SQL. Enforce LIMIT if absent."""
     prompt = f"""
 Write a {dialect} SQL from this plan. Use schema-qualified tables (include schema), safe to run, NO comments.
 Ensure a LIMIT {MAX_SQL_ROWS} at the end if not logically harmful.
+Copy filter literals from the plan verbatim.
 
 PLAN:
 {json.dumps(plan, ensure_ascii=False, indent=2)}
 
 SQL only:
 """
-    sql = generate(prompt)
+    sql = generate(prompt, temperature=temperature)
     # enforce LIMIT if missing
     if re.search(r"\bLIMIT\s+\d+", sql, re.I) is None:
         sql += f"\nLIMIT {MAX_SQL_ROWS}"
-    return sql.strip()
+    sql = sql.strip()
+    if ROLLUP_REWRITE:
+        sql, _rollup = rewrite_to_rollup(sql)
+    return sql
 
 # --------- SAFETY & VALIDATION ---------
 
@@ -170,6 +178,7 @@ def lint_sql(sql: str, dialect: str = "postgres") -> Dict[str, Any]:
     if not SCHEMA_QUAL.search(sql):
         return {"ok": False, "errors": ["Use schema-qualified tables (e.g., public.orders)"], "warnings": []}
     # AST parse
+    from sqlglot import parse_one
     try:
         parse_one(sql, read=dialect)
     except Exception as e:
@@ -195,33 +204,137 @@ def policy_guard(sql: str) -> Dict[str, Any]:
 def explain(sql: str) -> Dict[str, Any]:
     return explain_sql(sql)
 
-def cost_gate(plan: Dict[str, Any]) -> Dict[str, Any]:
-    est_rows = int(plan.get("est_rows", 0))
-    est_cost = float(plan.get("est_cost", 0))
-    if est_rows > MAX_EST_ROWS or est_cost > MAX_EST_COST:
+def cost_gate(plan: Dict[str, Any], sql: Optional[str] = None) -> Dict[str, Any]:
+    """Gate on predicted latency (ms) calibrated from query history, not raw planner cost."""
+    pred = predict_ms(sql, plan)
+    ms, rows = round(pred["ms"], 1), int(pred["rows"])
+    if rows > MAX_EST_ROWS or ms > MAX_QUERY_MS:
+        # a rejected query never runs, so an over-estimate would never be corrected:
+        # occasionally measure its LIMIT probe in the background
+        if sql and EXPLAIN_ANALYZE_SAMPLE_RATE > 0 and random.random() < EXPLAIN_ANALYZE_SAMPLE_RATE:
+            _executor().submit(_sample_rejected, sql, plan)
         return {
             "pass": False,
-            "reason": f"Too expensive: rows={est_rows} cost={est_cost}",
-            "suggested_patch": f"Add a date/tenant filter and LIMIT {MAX_SQL_ROWS}"
+            "reason": f"Too expensive: predicted {ms}ms (budget {MAX_QUERY_MS}ms) rows={rows} basis={pred['basis']}",
+            "suggested_patch": f"Add a date/tenant filter and LIMIT {MAX_SQL_ROWS}",
+            "predicted_ms": ms,
         }
-    return {"pass": True, "reason": "within thresholds", "suggested_patch": None}
+    return {"pass": True, "reason": f"predicted {ms}ms within {MAX_QUERY_MS}ms (basis={pred['basis']})",
+            "suggested_patch": None, "predicted_ms": ms}
 
-def dry_run_sample(sql: str, limit: int = 100) -> Dict[str, Any]:
+def _probe_sql(sql: str, limit: int = 100) -> str:
     # ensure small limit probe
     if re.search(r"\bLIMIT\s+\d+", sql, re.I):
-        probe = re.sub(r"\bLIMIT\s+\d+", f"LIMIT {min(limit,MAX_SQL_ROWS)}", sql, flags=re.I)
-    else:
-        probe = f"{sql.rstrip(';')}\nLIMIT {min(limit,MAX_SQL_ROWS)}"
+        return re.sub(r"\bLIMIT\s+\d+", f"LIMIT {min(limit,MAX_SQL_ROWS)}", sql, flags=re.I)
+    return f"{sql.rstrip(';')}\nLIMIT {min(limit,MAX_SQL_ROWS)}"
+
+def _sample_rejected(sql: str, explain: Dict[str, Any]) -> None:
+    try:
+        record_probe(sql, explain, explain_analyze_sql(_probe_sql(sql), limit_timeout_ms=8000)["raw"])
+    except Exception as e:
+        print(f"EXPLAIN ANALYZE sample of rejected query failed: {e}")
+
+def dry_run_sample(sql: str, limit: int = 100) -> Dict[str, Any]:
+    probe = _probe_sql(sql, limit)
     try:
         prev = run_sql(probe, limit_timeout_ms=8000)
-        return {"ok": True, "preview": prev}
     except Exception as e:
         return {"ok": False, "error": str(e)}
+    # occasionally re-run the probe under EXPLAIN ANALYZE to learn per-table row misestimates
+    # (scans the probe's LIMIT stops early are ignored by record_analyze)
+    if EXPLAIN_ANALYZE_SAMPLE_RATE > 0 and random.random() < EXPLAIN_ANALYZE_SAMPLE_RATE:
+        try:
+            record_analyze(explain_analyze_sql(probe, limit_timeout_ms=8000)["raw"])
+        except Exception as e:
+            print(f"EXPLAIN ANALYZE sample failed: {e}")
+    return {"ok": True, "preview": prev}
 
-def execute(sql: str) -> Dict[str, Any]:
-    return run_sql(sql, limit_timeout_ms=15000)
+def execute(sql: str, explain: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        res = run_sql(sql, limit_timeout_ms=15000)
+    except DeadlineExceeded:
+        raise  # budget gone before the query started: nothing learned
+    except Exception:
+        # timeouts/cancels are exactly the runs the cost model must learn from
+        record_execution(sql, explain, None, (time.perf_counter() - start) * 1000)
+        raise
+    record_execution(sql, explain, len(res["rows"]), (time.perf_counter() - start) * 1000)
+    return res
     # return generate(sql)
 
+# --------- SPECULATIVE CANDIDATES ---------
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+def _executor() -> ThreadPoolExecutor:
+    # shared by LLM calls and candidate checks; DB concurrency is bounded by the engine pool
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=max(4, SQL_CANDIDATES * 2), thread_name_prefix="sql-cand")
+    return _pool
+
+def check_candidate(sql: str) -> Dict[str, Any]:
+    """Run lint -> policy -> explain -> cost gate for one candidate, stopping at the first failure."""
+    out: Dict[str, Any] = {"sql": sql, "lint": lint_sql(sql), "policy_ok": False, "explain": None, "gate": None, "ok": False}
+    if not out["lint"].get("ok"):
+        return out
+    out["policy_ok"] = bool(policy_guard(sql).get("ok"))
+    if not out["policy_ok"]:
+        return out
+    try:
+        out["explain"] = explain(sql)
+    except Exception as e:
+        out["error"] = str(e)
+        return out
+    out["gate"] = cost_gate(out["explain"], sql)
+    out["ok"] = bool(out["gate"].get("pass"))
+    return out
+
+def speculative_sql(plan: Dict[str, Any], n: int = SQL_CANDIDATES, dialect: str = "postgres") -> Dict[str, Any]:
+    """Generate n SQL candidates concurrently, check each as soon as it arrives, return the cheapest valid one.
+
+    Once a candidate is valid, stragglers get SQL_CANDIDATE_GRACE_MS more and are then
+    abandoned, so one slow generation (retries, sleeps) doesn't hold up the node.
+    Falls back to the first candidate's check result when none is valid so the graph's
+    normal lint/policy/cost loops decide what to do next.
+    """
+    pool = _executor()
+    temps = [None] + [SQL_CANDIDATE_TEMPERATURE] * (n - 1)
+    gens = {submit(pool, generate_sql, plan, dialect, t): i for i, t in enumerate(temps)}
+    checking: Dict[Future, int] = {}
+    sqls: Dict[str, int] = {}; checks: Dict[int, Dict[str, Any]] = {}
+    pending = set(gens); cutoff: Optional[float] = None
+    while pending:
+        timeout = None if cutoff is None else max(0.0, cutoff - time.time())
+        finished, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not finished:
+            break  # grace period over
+        for f in finished:
+            if f in gens:
+                try:
+                    sql = f.result()
+                except Exception as e:
+                    print(f"Candidate generation failed: {e}")
+                    continue
+                if sql in sqls:
+                    continue
+                sqls[sql] = gens[f]
+                c = submit(pool, check_candidate, sql)
+                checking[c] = gens[f]; pending.add(c)
+            else:
+                checks[checking[f]] = f.result()
+                if checks[checking[f]]["ok"] and cutoff is None:
+                    cutoff = time.time() + SQL_CANDIDATE_GRACE_MS / 1000.0
+    for f in pending:
+        f.cancel()  # not started yet; running stragglers finish in the background
+    if not sqls:
+        raise RuntimeError("All SQL candidate generations failed")
+    valid = [c for c in checks.values() if c["ok"]]
+    best = min(valid, key=lambda c: c["explain"]["est_cost"]) if valid else checks[min(checks)]
+    best["candidates"] = len(sqls); best["valid"] = len(valid)
+    return best
+
 # --------- SUMMARIZATION ---------
 
 def summarize_result(question: str, result: Dict[str, Any], context: List[str]) -> str:
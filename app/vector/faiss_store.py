@@ -1,15 +1,17 @@
 from __future__ import annotations
-from typing import List, Dict
+from typing import Any, Callable, List, Dict, Optional
 from pathlib import Path
 import json, math
-import numpy as np, faiss
 import os, sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if ROOT not in sys.path:
     sys.path.append(ROOT)
-from app.llm.gemini import embed
+from app.llm import embed
 from app.config import FAISS_INDEX_PATH, FAISS_META_PATH
 
+# numpy/faiss are imported inside the functions that need them: importing this
+# module (e.g. via metadata_tools) must not pay for them.
+
 def _normalize(v: List[float]) -> List[float]:
     n = math.sqrt(sum(x*x for x in v)) or 1.0
     return [x/n for x in v]
@@ -22,13 +24,15 @@ def _dim() -> int:
         print("This might be due to API timeout or network issues. Check your GOOGLE_API_KEY and internet connection.")
         raise
 
-def _load_index(dim:int) -> faiss.Index:
+def _load_index(dim:int) -> Any:
+    import faiss
     p = Path(FAISS_INDEX_PATH)
     if p.exists():
         return faiss.read_index(str(p))
     return faiss.IndexFlatIP(dim)
 
-def _save_index(ix: faiss.Index) -> None:
+def _save_index(ix: Any) -> None:
+    import faiss
     Path(FAISS_INDEX_PATH).parent.mkdir(parents=True, exist_ok=True)
     faiss.write_index(ix, str(FAISS_INDEX_PATH))
 
@@ -42,7 +46,8 @@ def _save_meta(meta: List[Dict]) -> None:
     Path(FAISS_META_PATH).parent.mkdir(parents=True, exist_ok=True)
     Path(FAISS_META_PATH).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
 
-def add_texts(cards: List[str], sources: List[str]) -> int:
+def add_texts(cards: List[str], sources: List[str], parents: Optional[List[Optional[str]]] = None) -> int:
+    import numpy as np
     dim = _dim()
     ix = _load_index(dim)
     meta = _load_meta()
@@ -51,7 +56,10 @@ def add_texts(cards: List[str], sources: List[str]) -> int:
         try:
             vec = _normalize(embed([text])[0])
             ix.add(np.array([vec], dtype="float32"))
-            meta.append({"source": sources[i], "content": text})
+            entry = {"source": sources[i], "content": text}
+            if parents and parents[i]:
+                entry["parent"] = parents[i]
+            meta.append(entry)
             added += 1
         except Exception as e:
             print(f"Failed to embed text {i+1}/{len(cards)} from source '{sources[i]}': {e}")
@@ -60,7 +68,53 @@ def add_texts(cards: List[str], sources: List[str]) -> int:
     _save_index(ix); _save_meta(meta)
     return added
 
-def search(query: str, k: int) -> List[str]:
+class IndexWriter:
+    """Appends pre-computed vectors to the on-disk index/meta; used by the ingestion pipeline.
+
+    truncate_to drops anything written after the last checkpoint of a crashed run;
+    replace(source) -> True drops existing entries a fresh run is about to re-ingest.
+    """
+    def __init__(self, truncate_to: Optional[int] = None, replace: Optional[Callable[[str], bool]] = None):
+        import numpy as np, faiss
+        p = Path(FAISS_INDEX_PATH)
+        self.ix: Optional[Any] = faiss.read_index(str(p)) if p.exists() else None
+        self.meta = _load_meta()
+        n = min(len(self.meta), self.ix.ntotal if self.ix is not None else 0)
+        if truncate_to is not None:
+            n = min(n, truncate_to)
+        if self.ix is not None and self.ix.ntotal > n:
+            self.ix.remove_ids(faiss.IDSelectorRange(n, self.ix.ntotal))
+        self.meta = self.meta[:n]
+        if replace is not None and self.meta:
+            stale = [i for i, e in enumerate(self.meta) if replace(e.get("source", ""))]
+            if stale and self.ix is not None:
+                # flat index ids are positions: removal shifts later ids down, as for meta
+                self.ix.remove_ids(faiss.IDSelectorBatch(np.array(stale, dtype="int64")))
+            drop = set(stale)
+            self.meta = [e for i, e in enumerate(self.meta) if i not in drop]
+
+    @property
+    def size(self) -> int:
+        return len(self.meta)
+
+    def add(self, entries: List[Dict], vecs: List[List[float]]) -> None:
+        import numpy as np, faiss
+        if self.ix is None:
+            self.ix = faiss.IndexFlatIP(len(vecs[0]))
+        self.ix.add(np.array([_normalize(v) for v in vecs], dtype="float32"))
+        self.meta.extend(entries)
+
+    def save(self) -> None:
+        if self.ix is not None:
+            _save_index(self.ix)
+        _save_meta(self.meta)
+
+def all_entries() -> List[Dict]:
+    return _load_meta()
+
+def search_entries(query: str, k: int) -> List[Dict]:
+    """Top-k meta entries ({source, content, score}) by inner product."""
+    import numpy as np, faiss
     meta = _load_meta()
     p = Path(FAISS_INDEX_PATH)
     if not meta or not p.exists():
@@ -69,10 +123,13 @@ def search(query: str, k: int) -> List[str]:
         qv = _normalize(embed([query])[0])
         ix = faiss.read_index(str(p))
         D, I = ix.search(np.array([qv], dtype="float32"), min(k, len(meta)))
-        return [meta[idx]["content"] for idx in I[0] if 0 <= idx < len(meta)]
+        return [dict(meta[idx], score=float(d)) for d, idx in zip(D[0], I[0]) if 0 <= idx < len(meta)]
     except Exception as e:
         print(f"Error during search: {e}")
         return []
 
+def search(query: str, k: int) -> List[str]:
+    return [e["content"] for e in search_entries(query, k)]
+
 if __name__ == "__main__":
     print(_dim())
\ No newline at end of file
@@ -0,0 +1,172 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Optional, Set
+from pathlib import Path
+import json, math, re
+import os, sys
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+from app.config import LEXICAL_INDEX_PATH, LEXICAL_MAX_COLUMN_DF
+
+# BM25 over identifiers (schema.table, table, column, metric names) and comments
+# of the same cards stored in FAISS. Lets exact names be resolved without an
+# embedding round trip.
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+IDENT = re.compile(r"[a-z_][a-z0-9_]*(?:\.[a-z_][a-z0-9_]*)?")
+STOPWORDS = {
+    "a","an","and","are","as","at","be","by","for","from","how","in","is","it","of","on",
+    "or","per","the","to","was","were","what","which","who","with","each","all","show",
+    "list","give","me","many","much","did","does","do","i","we","our","my",
+}
+
+_cache: Dict[str, Any] = {"mtime": None, "index": None}
+
+def _tokens(text: str) -> List[str]:
+    """Identifier-aware tokens: `public.order_items` -> public.order_items, order_items, order, items."""
+    out: List[str] = []
+    for tok in IDENT.findall(text.lower()):
+        parts = tok.split(".")
+        if len(parts) == 2:
+            out.append(tok)
+        for p in parts:
+            if p in STOPWORDS:
+                continue
+            out.append(p)
+            subs = [s for s in p.split("_") if s]
+            if len(subs) > 1:
+                out += [s for s in subs if s not in STOPWORDS]
+    return out
+
+def _card_fields(content: str) -> Dict[str, Any]:
+    """Pull identifiers and free-text comments out of a schema/metric card."""
+    tables: List[str] = []; columns: List[str] = []; metrics: List[str] = []; comments: List[str] = []
+    in_desc = False
+    for line in content.splitlines():
+        s = line.strip()
+        if s.startswith("TABLE:"):
+            full = s[len("TABLE:"):].strip()
+            if full and full != "None":
+                tables += [full, full.split(".")[-1]]
+            in_desc = False
+        elif s.startswith("COLUMNS:"):
+            columns += [c.strip() for c in s[len("COLUMNS:"):].split(",") if c.strip()]
+            in_desc = False
+        elif s.startswith("COLUMN:"):
+            m = re.match(r"([A-Za-z_][\w]*)", s[len("COLUMN:"):].strip())
+            if m:
+                columns.append(m.group(1))
+            in_desc = False
+        elif s.startswith("NAME:"):
+            metrics.append(s[len("NAME:"):].strip()); in_desc = False
+        elif s.startswith("DEFINITION:"):
+            comments.append(s[len("DEFINITION:"):].strip()); in_desc = False
+        elif s.startswith("DESCRIPTION:"):
+            comments.append(s[len("DESCRIPTION:"):].strip()); in_desc = True
+        elif s.startswith(("STATS:", "EXAMPLES:", "SAMPLE_ROWS:")):
+            # sampled values, so questions that quote a literal ("refunded") hit its column
+            comments.append(s.split(":", 1)[1].strip()); in_desc = True
+        elif s.startswith("- ") and not in_desc:
+            m = re.match(r"-\s+([A-Za-z_][\w]*)\s*\(", s)
+            if m:
+                columns.append(m.group(1))
+        elif in_desc and s:
+            comments.append(s)
+    return {"tables": tables, "columns": columns, "metrics": metrics, "comments": comments}
+
+def build_lexical_index(entries: List[Dict[str, Any]]) -> int:
+    """Build and persist the BM25 index from FAISS meta entries ({source, content})."""
+    docs: List[Dict[str, Any]] = []
+    postings: Dict[str, Dict[int, int]] = {}
+    names: Dict[str, List[str]] = {"tables": [], "metrics": []}
+    column_tables: Dict[str, Set[str]] = {}
+    # re-ingestion appends to FAISS meta; keep only the latest card per source
+    latest = list({e.get("source"): e for e in entries}.values())
+    for i, e in enumerate(latest):
+        f = _card_fields(e.get("content", ""))
+        # a column card's TABLE: line only names its owner; indexing it would make every
+        # column of a table an equal hit for any question that names the table
+        own_tables = [] if e.get("parent") else f["tables"]
+        terms = _tokens(" ".join(own_tables + f["columns"] + f["metrics"] + f["comments"]))
+        for t in terms:
+            postings.setdefault(t, {}).setdefault(i, 0)
+            postings[t][i] += 1
+        owner = f["tables"][0].lower() if f["tables"] else str(i)
+        for c in f["columns"]:
+            column_tables.setdefault(c.lower(), set()).add(owner)
+        names["tables"] += [x.lower() for x in f["tables"]]
+        names["metrics"] += [x.lower() for x in f["metrics"] if x]
+        docs.append({"source": e.get("source"), "parent": e.get("parent"), "content": e.get("content", ""), "len": len(terms)})
+    avgdl = (sum(d["len"] for d in docs) / len(docs)) if docs else 0.0
+    index = {
+        "docs": docs,
+        "avgdl": avgdl,
+        "postings": {t: [[d, tf] for d, tf in p.items()] for t, p in postings.items()},
+        "tables": sorted(set(names["tables"])),
+        "metrics": sorted(set(names["metrics"])),
+        "column_df": {c: len(t) for c, t in column_tables.items()},
+    }
+    Path(LEXICAL_INDEX_PATH).parent.mkdir(parents=True, exist_ok=True)
+    Path(LEXICAL_INDEX_PATH).write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+    _cache["mtime"] = None
+    return len(docs)
+
+def _load() -> Dict[str, Any] | None:
+    p = Path(LEXICAL_INDEX_PATH)
+    if not p.exists():
+        return None
+    mtime = p.stat().st_mtime
+    if _cache["mtime"] != mtime:
+        _cache["index"] = json.loads(p.read_text(encoding="utf-8"))
+        _cache["mtime"] = mtime
+    return _cache["index"]
+
+def exact_identifiers(query: str) -> Set[str]:
+    """Table/metric names, or distinctive column names, that appear verbatim in the query."""
+    ix = _load()
+    if not ix:
+        return set()
+    words = set(IDENT.findall(query.lower()))
+    words |= {w.split(".")[-1] for w in words}
+    hits = words & (set(ix["tables"]) | set(ix["metrics"]))
+    df = ix.get("column_df", {})
+    hits |= {w for w in words if w not in STOPWORDS and 0 < df.get(w, 0) <= LEXICAL_MAX_COLUMN_DF}
+    return hits
+
+def lexical_search(query: str, k: int) -> List[Dict[str, Any]]:
+    """Top-k BM25 hits as [{source, parent, content, score}]."""
+    ix = _load()
+    if not ix or not ix["docs"]:
+        return []
+    n = len(ix["docs"]); avgdl = ix["avgdl"] or 1.0
+    tables = set(ix["tables"])
+    qterms: Set[str] = set()
+    for tok in IDENT.findall(query.lower()):
+        # a table named verbatim matches its table card whole; its word parts ("order" of
+        # order_items) would otherwise pull in unrelated columns like order_id
+        qterms |= {tok, tok.split(".")[-1]} if tok.split(".")[-1] in tables else set(_tokens(tok))
+    scores: Dict[int, float] = {}
+    for t in qterms:
+        plist = ix["postings"].get(t)
+        if not plist:
+            continue
+        idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+        for d, tf in plist:
+            dl = ix["docs"][d]["len"]
+            scores[d] = scores.get(d, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl))
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+    return [dict(ix["docs"][d], score=s) for d, s in ranked]
+
+def get_card(source: str) -> Optional[str]:
+    """Card content for a source (e.g. the parent table card of a column hit)."""
+    ix = _load()
+    if not ix:
+        return None
+    if "by_source" not in ix:
+        ix["by_source"] = {d["source"]: d["content"] for d in ix["docs"]}
+    return ix["by_source"].get(source)
+
+if __name__ == "__main__":
+    print(lexical_search(" ".join(sys.argv[1:]) or "actor", 4))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Offline checks for the execution-feedback cost model: which scans count as row
+misestimates, and which history tier predict_ms picks (temp SQLite history, no database).
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from app.tools import cost_model
+
+def scan(table, plan_rows, actual_rows, loops=1):
+    return {"Node Type": "Seq Scan", "Relation Name": table, "Schema": "public",
+            "Plan Rows": plan_rows, "Actual Rows": actual_rows, "Actual Loops": loops}
+
+@pytest.fixture(autouse=True)
+def history(tmp_path, monkeypatch):
+    monkeypatch.setattr(cost_model, "QUERY_HISTORY_PATH", str(tmp_path / "history.sqlite"))
+    monkeypatch.setattr(cost_model, "_initialized", False)
+
+# ---------- _scan_nodes ----------
+
+def test_inner_loop_scan_compared_per_loop():
+    plan = {"Node Type": "Nested Loop", "Plans": [scan("orders", 1000, 1000), scan("items", 1, 1, loops=5000)]}
+    assert list(cost_model._scan_nodes(plan)) == [("public.orders", 1000.0, 1000.0), ("public.items", 1.0, 1.0)]
+
+def test_scan_cut_short_by_limit_is_skipped():
+    plan = {"Node Type": "Limit", "Plans": [scan("big", 1e6, 100)]}
+    assert list(cost_model._scan_nodes(plan)) == []
+
+def test_scan_below_blocking_node_is_kept():
+    plan = {"Node Type": "Limit", "Plans": [{"Node Type": "Aggregate", "Plans": [scan("big", 1e6, 9e5)]}]}
+    assert list(cost_model._scan_nodes(plan)) == [("public.big", 1e6, 9e5)]
+
+def test_limit_below_blocking_node_still_truncates():
+    plan = {"Node Type": "Sort", "Plans": [{"Node Type": "Limit", "Plans": [scan("big", 1e6, 10)]}]}
+    assert list(cost_model._scan_nodes(plan)) == []
+
+def test_never_executed_scan_is_skipped():
+    plan = {"Node Type": "Nested Loop", "Plans": [scan("orders", 10, 0, loops=0)]}
+    assert list(cost_model._scan_nodes(plan)) == []
+
+# ---------- predict_ms ----------
+
+SQL = "SELECT count(*) FROM public.orders WHERE created_at > '2024-01-01'"
+
+def test_default_basis_without_history():
+    pred = cost_model.predict_ms(SQL, {"est_cost": 1000, "est_rows": 10})
+    assert pred["basis"] == "default"
+    assert pred["ms"] == pytest.approx(1000 * cost_model.DEFAULT_MS_PER_COST)
+
+def test_default_basis_scaled_by_row_misestimate():
+    cost_model.record_analyze({"Plan": scan("orders", 100, 1000)})
+    pred = cost_model.predict_ms(SQL, {"est_cost": 1000, "est_rows": 10})
+    assert pred["basis"] == "default"
+    assert pred["rows"] == pytest.approx(100)
+    assert pred["ms"] == pytest.approx(1000 * cost_model.DEFAULT_MS_PER_COST * 10)
+
+def test_tables_basis_from_other_queries_on_same_table():
+    cost_model.record_execution("SELECT id FROM public.orders WHERE id = 1", {"est_cost": 100, "est_rows": 1}, 1, 20)
+    pred = cost_model.predict_ms(SQL, {"est_cost": 1000, "est_rows": 10})
+    assert pred["basis"] == "tables"
+    assert pred["ms"] == pytest.approx(200)
+
+def test_fingerprint_basis_scaled_by_cost():
+    cost_model.record_execution(SQL, {"est_cost": 100, "est_rows": 1}, 1, 50)
+    # same shape, different literal, 1000x the planner cost: must not inherit the cheap runtime
+    wider = SQL.replace("2024-01-01", "2000-01-01")
+    pred = cost_model.predict_ms(wider, {"est_cost": 100000, "est_rows": 1})
+    assert pred["basis"] == "fingerprint"
+    assert pred["ms"] == pytest.approx(50000)
+
+def test_probe_runtime_recorded_only_when_not_truncated():
+    truncated = {"Plan": {"Node Type": "Limit", "Actual Rows": 100, "Plans": [scan("orders", 1e6, 100)]}, "Execution Time": 3.0}
+    cost_model.record_probe(SQL, {"est_cost": 1e5, "est_rows": 1e6}, truncated)
+    assert cost_model.predict_ms(SQL, {"est_cost": 1e5, "est_rows": 1e6})["basis"] == "default"
+    full = {"Plan": {"Node Type": "Limit", "Actual Rows": 1, "Plans": [
+        {"Node Type": "Aggregate", "Plans": [scan("orders", 1e6, 1e6)]}]}, "Execution Time": 40.0}
+    cost_model.record_probe(SQL, {"est_cost": 1e5, "est_rows": 1}, full)
+    pred = cost_model.predict_ms(SQL, {"est_cost": 1e5, "est_rows": 1})
+    assert pred["basis"] == "fingerprint" and pred["ms"] == pytest.approx(40.0)
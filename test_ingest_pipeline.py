@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Offline checks for the staged ingestion pipeline with fake stage callables: failures
+propagate instead of hanging, and only fully embedded units are checkpointed as done.
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from app.ingestion.pipeline import run_pipeline
+
+UNITS = ["s.a", "s.b", "s.c"]
+
+def _run(embed_batch, embedders, checkpoints=None, written=None, batch_size=4, timeout=10):
+    """run_pipeline in a thread; returns its result or exception, failing the test if it hangs."""
+    out = {}
+    def go():
+        try:
+            out["result"] = run_pipeline(
+                ["s"], lambda s: UNITS, lambda u: [{"source": f"{u}.{i}", "content": u} for i in range(2)],
+                embed_batch,
+                lambda entries, vecs: (written if written is not None else []).extend(entries),
+                lambda done: (checkpoints if checkpoints is not None else []).append(set(done)),
+                done=set(), readers=1, builders=2, embedders=embedders, batch_size=batch_size)
+        except Exception as e:
+            out["error"] = e
+    t = threading.Thread(target=go, daemon=True)
+    t.start(); t.join(timeout)
+    assert not t.is_alive(), "run_pipeline hung"
+    return out
+
+@pytest.mark.parametrize("embedders", [1, 4])
+def test_embed_failure_propagates_instead_of_hanging(embedders):
+    def boom(texts):
+        raise RuntimeError("embed failed")
+    # one batch larger than the whole run: the worker has consumed its end marker when it fails
+    out = _run(boom, embedders, batch_size=100)
+    assert isinstance(out.get("error"), RuntimeError)
+
+def test_all_units_written():
+    checkpoints, written = [], []
+    out = _run(lambda texts: [[1.0, 0.0]] * len(texts), 2, checkpoints, written)
+    assert out["result"] == 6 and len(written) == 6
+    assert checkpoints[-1] == set(UNITS)
+
+def test_partially_embedded_unit_is_not_done():
+    checkpoints, written = [], []
+    embed = lambda texts: [None if t == "s.b" else [1.0, 0.0] for t in texts]
+    out = _run(embed, 1, checkpoints, written)
+    assert "failed to embed" in str(out.get("error"))
+    assert checkpoints[-1] == {"s.a", "s.c"}
+    assert all(e["content"] != "s.b" for e in written)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Offline checks for hybrid retrieval (MockClient embeddings, temp FAISS/BM25 indexes):
+questions naming objects exactly are answered without an embedding call, RRF fuses
+rankings by rank, and column hits roll up to their parent table.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+pytest.importorskip("faiss")
+
+from app import llm
+from app.llm.mock import MockClient
+from app.tools import metadata_tools
+from app.vector import faiss_store, lexical_store
+
+def table_card(table, cols, desc=""):
+    return (f"DB SCHEMA CARD\nTABLE: public.{table}\nCOLUMNS: {', '.join(cols)}\nPRIMARY_KEY: id\n"
+            f"FOREIGN_KEYS:\n(none)\nDESCRIPTION:\n{desc}")
+
+def column_card(table, col, desc=""):
+    return (f"DB COLUMN CARD\nTABLE: public.{table}\nCOLUMN: {col} (integer, nullable=NO, default=None)\n"
+            f"PRIMARY_KEY: no\nREFERENCES: (none)\nDESCRIPTION: {desc}")
+
+TABLES = {
+    "order_items": (["id", "order_id", "qty", "price"], "Line items of customer orders"),
+    "customers": (["id", "email", "signup_date"], "People who bought something"),
+}
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(faiss_store, "FAISS_INDEX_PATH", str(tmp_path / "faiss.index"))
+    monkeypatch.setattr(faiss_store, "FAISS_META_PATH", str(tmp_path / "meta.json"))
+    monkeypatch.setattr(lexical_store, "LEXICAL_INDEX_PATH", str(tmp_path / "lexical.json"))
+    mock = MockClient()
+    llm.set_client(mock)
+    entries = []
+    for table, (cols, desc) in TABLES.items():
+        parent = f"schema://public.{table}"
+        entries.append({"source": parent, "content": table_card(table, cols, desc)})
+        entries += [{"source": f"column://public.{table}.{c}", "content": column_card(table, c), "parent": parent} for c in cols]
+    writer = faiss_store.IndexWriter()
+    writer.add(entries, mock.embed([e["content"] for e in entries]))
+    writer.save()
+    lexical_store.build_lexical_index(faiss_store.all_entries())
+    mock.calls["embed"] = 0
+    yield mock
+    llm.set_client(None)
+
+def test_exact_names_skip_embedding(client):
+    ctx = metadata_tools.retrieve_metadata("total qty of order_items", k=2)
+    assert client.calls["embed"] == 0
+    assert ctx[0].startswith(table_card("order_items", TABLES["order_items"][0], TABLES["order_items"][1]))
+    assert "MATCHED_COLUMNS:\n- qty" in ctx[0]
+
+def test_fuzzy_question_uses_vector_search(client):
+    metadata_tools.retrieve_metadata("who bought something", k=2)
+    assert client.calls["embed"] == 1
+
+def test_rrf_orders_by_summed_reciprocal_rank():
+    a, b, c = ({"source": s} for s in ("a", "b", "c"))
+    fused = metadata_tools._rrf([a, b, c], [b, c, a])
+    assert [e["source"] for e, _ in fused] == ["b", "a", "c"]
+    k = metadata_tools.HYBRID_RRF_K
+    assert fused[0][1] == pytest.approx(1 / (k + 2) + 1 / (k + 1))
+
+def test_aggregate_rolls_columns_up_to_parent(client):
+    parent = "schema://public.order_items"
+    hits = [
+        ({"source": "column://public.order_items.qty", "parent": parent, "content": column_card("order_items", "qty")}, 0.5),
+        ({"source": "schema://public.customers", "content": table_card("customers", TABLES["customers"][0])}, 0.6),
+        ({"source": "column://public.order_items.price", "parent": parent, "content": column_card("order_items", "price")}, 0.4),
+    ]
+    out = metadata_tools._aggregate(hits, k=2)
+    # the two column hits add up (0.9) and outrank the single table hit (0.6)
+    assert out[0].startswith("DB SCHEMA CARD\nTABLE: public.order_items")  # parent card fetched via get_card
+    assert out[0].endswith("MATCHED_COLUMNS:\n- qty (integer, nullable=NO, default=None)\n- price (integer, nullable=NO, default=None)")
+    assert out[1].startswith("DB SCHEMA CARD\nTABLE: public.customers") and "MATCHED_COLUMNS" not in out[1]
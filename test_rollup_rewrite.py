@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Offline checks for the rollup rewriter (sqlglot only, no database): queries a rollup
+can answer are redirected, everything else is left untouched.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from app.tools import rollup_tools
+
+DAILY = {
+    "name": "public.payment_daily",
+    "source": "public.payment",
+    "time_column": "payment_date",
+    "grain": "day",
+    "period_column": "period",
+    "dimensions": ["staff_id", "customer_id"],
+    "measures": {"amount_sum": "sum(amount)", "amount_count": "count(amount)", "payment_count": "count(*)"},
+    "rows": 250000,
+}
+
+@pytest.fixture(autouse=True)
+def rollups(monkeypatch):
+    monkeypatch.setattr(rollup_tools, "load_rollups", lambda: [DAILY])
+
+def rewrite(sql):
+    return rollup_tools.rewrite_to_rollup(sql)
+
+def test_sum_by_dimension():
+    sql, name = rewrite("SELECT staff_id, sum(amount) AS total FROM public.payment GROUP BY staff_id ORDER BY total DESC")
+    assert name == "public.payment_daily"
+    assert "FROM public.payment_daily" in sql and "SUM(amount_sum)" in sql
+    assert "ORDER BY total DESC" in sql
+
+def test_count_star_is_resummed():
+    sql, name = rewrite("SELECT customer_id, count(*) FROM public.payment GROUP BY customer_id")
+    assert name and "COALESCE(SUM(payment_count), 0)" in sql
+
+def test_count_over_no_rows_stays_zero():
+    # SUM over no rollup rows is NULL where count() was 0
+    sql, name = rewrite("SELECT count(*) FROM public.payment WHERE staff_id = 99")
+    assert name
+    assert sql == "SELECT COALESCE(SUM(payment_count), 0) FROM public.payment_daily WHERE staff_id = 99"
+
+def test_filtered_count_keeps_filter_inside_coalesce():
+    sql, name = rewrite("SELECT staff_id, count(*) FILTER (WHERE customer_id = 1) FROM public.payment GROUP BY staff_id")
+    assert name
+    assert "COALESCE(SUM(payment_count) FILTER(WHERE customer_id = 1), 0)" in sql
+
+def test_avg_from_sum_and_count():
+    sql, name = rewrite("SELECT staff_id, avg(amount) FROM public.payment GROUP BY staff_id")
+    assert name and "SUM(amount_sum)" in sql and "NULLIF(SUM(amount_count), 0)" in sql
+
+def test_coarser_grain_and_aligned_range():
+    sql, name = rewrite(
+        "SELECT date_trunc('month', payment_date) AS m, sum(amount) FROM public.payment "
+        "WHERE payment_date >= '2024-01-01' AND payment_date < '2024-04-01' GROUP BY m ORDER BY m")
+    assert name
+    assert "period >= '2024-01-01'" in sql and "period < '2024-04-01'" in sql
+    assert "payment_date" not in sql
+
+def test_filter_on_dimension():
+    _, name = rewrite("SELECT staff_id, sum(amount) FROM public.payment WHERE customer_id = 7 GROUP BY staff_id")
+    assert name
+
+@pytest.mark.parametrize("sql", [
+    # alias shadows a source column in WHERE: that's the raw column, not on the rollup
+    "SELECT staff_id, sum(amount) AS amount FROM public.payment WHERE amount > 5 GROUP BY staff_id",
+    # finer grain than the rollup
+    "SELECT date_trunc('hour', payment_date), sum(amount) FROM public.payment GROUP BY 1",
+    # range literal not on a day boundary
+    "SELECT staff_id, sum(amount) FROM public.payment WHERE payment_date >= '2024-01-01 12:00' GROUP BY staff_id",
+    # raw time column
+    "SELECT payment_date, sum(amount) FROM public.payment GROUP BY payment_date",
+    # non-dimension column
+    "SELECT rental_id, sum(amount) FROM public.payment GROUP BY rental_id",
+    # measure the rollup doesn't have / can't re-aggregate
+    "SELECT staff_id, max(amount) FROM public.payment GROUP BY staff_id",
+    "SELECT staff_id, count(DISTINCT customer_id) FROM public.payment GROUP BY staff_id",
+    # joins, row-level queries and other tables
+    "SELECT p.staff_id, sum(p.amount) FROM public.payment p JOIN public.staff s ON s.staff_id = p.staff_id GROUP BY p.staff_id",
+    "SELECT staff_id, amount FROM public.payment",
+    "SELECT staff_id, sum(amount) FROM public.rental GROUP BY staff_id",
+])
+def test_left_unchanged(sql):
+    assert rewrite(sql) == (sql, None)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check: the CLI entry point must not pull in the heavy stacks
+(LLM SDK, FAISS/numpy, SQLAlchemy, sqlglot, langgraph) and `--help` must start fast.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+
+BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.0"))
+HEAVY = ["google.generativeai", "faiss", "numpy", "sqlalchemy", "sqlglot", "langgraph"]
+
+def _run(code_or_args):
+    return subprocess.run([sys.executable, *code_or_args], cwd=ROOT, capture_output=True, text=True)
+
+def test_cli_imports_are_light():
+    probe = f"import sys, app.cli; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    out = _run(["-c", probe])
+    assert out.returncode == 0, out.stderr
+    loaded = out.stdout.strip()
+    assert not loaded, f"app.cli imported heavy modules at import time: {loaded}"
+
+def test_cli_help_within_budget():
+    start = time.perf_counter()
+    out = _run(["-m", "app.cli", "--help"])
+    elapsed = time.perf_counter() - start
+    assert out.returncode == 0, out.stderr
+    assert "Usage:" in out.stdout
+    assert elapsed < BUDGET_SECONDS, f"`app.cli --help` took {elapsed:.2f}s (budget {BUDGET_SECONDS}s)"
+
+if __name__ == "__main__":
+    ok = True
+    for t in (test_cli_imports_are_light, test_cli_help_within_budget):
+        try:
+            t()
+            print(f"{t.__name__}: ok")
+        except AssertionError as e:
+            print(f"{t.__name__}: FAILED - {e}")
+            ok = False
+    sys.exit(0 if ok else 1)